@@ -0,0 +1,77 @@
+#! /usr/bin/env python
+################################################
+# This is the stand alone version of Mantrack, #
+# a tool from the AnimTrack package by J.W.    #
+# Jolles. Do not distribute!                   #
+################################################
+
+"""
+Measures the time it takes to import (parts of) mantrack in a fresh python
+process, and which heavy dependencies each import loads.
+
+Usage: python benchmarks/bench_import.py [--repeats 10]
+"""
+
+from __future__ import print_function
+
+import sys
+import json
+import argparse
+import subprocess
+
+import numpy as np
+
+
+STATEMENTS = [("version", "import mantrack; mantrack.__version__"),
+              ("data", "from mantrack import load_data, save_data"),
+              ("batch", "from mantrack import batch_process"),
+              ("gui", "from mantrack import Track_Manual")]
+
+HEAVY = ["cv2", "pandas", "numpy", "animlab"]
+
+SCRIPT = """
+import sys, time
+t = time.perf_counter()
+%s
+t = time.perf_counter() - t
+print(repr((t, [m for m in %r if m in sys.modules])))
+"""
+
+
+def time_import(statement, repeats = 10):
+
+    """Returns the import times in seconds and the heavy modules loaded"""
+
+    times = []
+    for _ in range(repeats):
+        out = subprocess.check_output([sys.executable, "-c",
+                                       SCRIPT % (statement, HEAVY)])
+        t, loaded = eval(out.decode().strip().splitlines()[-1])
+        times.append(t)
+
+    return np.array(times), loaded
+
+
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description = "mantrack import benchmark")
+    parser.add_argument("-n", "--repeats", type = int, default = 10)
+    parser.add_argument("--json", help = "file to write the results to")
+    args = parser.parse_args(argv)
+
+    results = {}
+    print("%-8s %10s %10s  %s" % ("import", "median ms", "max ms", "loads"))
+    for label, statement in STATEMENTS:
+        times, loaded = time_import(statement, args.repeats)
+        results[label] = {"statement": statement, "median_ms": 1000*np.median(times),
+                          "max_ms": 1000*times.max(), "loads": loaded}
+        print("%-8s %10.1f %10.1f  %s" % (label, 1000*np.median(times),
+                                          1000*times.max(), ", ".join(loaded)))
+
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent = 2)
+
+
+if __name__ == "__main__":
+    main()
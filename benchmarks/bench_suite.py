@@ -0,0 +1,224 @@
+#! /usr/bin/env python
+################################################
+# This is the stand alone version of Mantrack, #
+# a tool from the AnimTrack package by J.W.    #
+# Jolles. Do not distribute!                   #
+################################################
+
+"""
+Headless benchmark of the hot paths of mantrack on a synthetic video:
+frame navigation (sequential and random steps), drawing with and without
+the track overlay, creating, loading and comparing annotation data and
+saving. The results are written as json, such that releases can be
+compared.
+
+Usage: python benchmarks/bench_suite.py --frames 1000 --width 1280
+       --height 720 --codec mp4v --json results.json
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+
+import cv2
+import numpy as np
+import pandas as pd
+
+import mantrack
+from mantrack.datastore import AnnotationStore, EditLog, FORMATS, load_data, save_data
+from mantrack.profiler import LatencyProfiler
+
+
+def make_video(vidfile, nframes = 1000, width = 1280, height = 720,
+               codec = "mp4v", fps = 25):
+
+    """
+    Writes a synthetic video with a textured background and moving animals,
+    such that it compresses like a real recording
+    """
+
+    rng = np.random.RandomState(0)
+    background = cv2.GaussianBlur((rng.rand(height, width, 3) * 255).astype(np.uint8), (0,0), 3)
+    writer = cv2.VideoWriter(vidfile, cv2.VideoWriter_fourcc(*codec), fps, (width, height))
+    if not writer.isOpened():
+        raise IOError("Could not write video with codec "+codec)
+
+    t = np.arange(nframes) / float(fps)
+    for i in range(nframes):
+        frame = background.copy()
+        for k in range(3):
+            x = int(width * (0.5 + 0.35 * np.sin(0.3 * t[i] + 2 * k)))
+            y = int(height * (0.5 + 0.35 * np.cos(0.2 * t[i] + k)))
+            cv2.circle(frame, (x, y), max(int(height / 40), 3), (20, 20, 20), -1)
+        cv2.putText(frame, str(i), (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (255,255,255), 2)
+        writer.write(frame)
+    writer.release()
+
+
+def fill_store(store, ids, columns, every = 1):
+
+    """Fills a store with a point for each id every few frames"""
+
+    rng = np.random.RandomState(1)
+    for frame in range(store.first, store.last + 1, every):
+        for id in ids:
+            store.set(store.loc(frame, id), columns, rng.rand(len(columns)) * 500)
+
+
+def bench_navigation(profiler, tm, nsteps, seed = 0):
+
+    tm.uset_frameloc(-tm.lastframe)
+    for _ in range(nsteps):
+        with profiler.stage("reset sequential"):
+            tm.uset_frameloc(1)
+
+    rng = np.random.RandomState(seed)
+    for frame in rng.randint(tm.firstframe, tm.lastframe, nsteps):
+        with profiler.stage("reset random"):
+            tm.uset_frameloc(frame - 1 - tm.frameloc)
+
+
+def bench_draw(profiler, tm, ndraws):
+
+    for drawcoords in [False, True]:
+        tm.drawcoords = drawcoords
+        label = "draw overlay" if drawcoords else "draw"
+        for _ in range(ndraws):
+            with profiler.stage(label):
+                tm.draw()
+        tm.overlays = {}
+        for _ in range(max(int(ndraws / 10), 1)):
+            with profiler.stage(label + " rebuild"):
+                tm.draw()
+            tm.overlays = {}
+    tm.drawcoords = False
+
+
+def bench_data(profiler, workdir, nframes, ids, columns, repeats, formats):
+
+    for _ in range(repeats):
+        with profiler.stage("store create"):
+            store = AnnotationStore(columns, ids, 1, nframes)
+    fill_store(store, ids, columns, every = 3)
+
+    data = store.to_df()
+    for fileformat in formats:
+        datafile = os.path.join(workdir, "data" + FORMATS[fileformat])
+        for _ in range(repeats):
+            with profiler.stage("save " + fileformat):
+                save_data(data, datafile)
+        for _ in range(repeats):
+            with profiler.stage("load " + fileformat):
+                AnnotationStore.from_df(load_data(datafile))
+
+    editlog = EditLog()
+    rng = np.random.RandomState(2)
+    for frame in rng.randint(1, nframes + 1, 100):
+        loc = store.loc(frame, ids[0])
+        editlog.record(frame, ids[0], columns[:2], store.get(loc, columns[:2]), (1, 1))
+        store.set(loc, columns[:2], (1, 1))
+    for _ in range(repeats):
+        with profiler.stage("changes"):
+            store.select([store.loc(*key) for key in editlog.changed()])
+
+
+def bench_savedat(profiler, tm, repeats):
+
+    fill_store(tm.store, tm.ids, tm.columns, every = 3)
+    for frame in range(tm.firstframe, tm.lastframe, 7):
+        tm.setdata(tm.subcolumns, (5, 5), frame)
+    stdout = sys.stdout
+    for _ in range(repeats):
+        sys.stdout = open(os.devnull, "w")
+        try:
+            with profiler.stage("savedat"):
+                tm.savedat()
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description = "mantrack benchmark suite")
+    parser.add_argument("--frames", type = int, default = 1000)
+    parser.add_argument("--width", type = int, default = 1280)
+    parser.add_argument("--height", type = int, default = 720)
+    parser.add_argument("--codec", default = "mp4v", help = "fourcc, e.g. mp4v, MJPG, XVID")
+    parser.add_argument("--ext", default = ".mp4", help = "extension of the video file")
+    parser.add_argument("--fps", type = int, default = 25)
+    parser.add_argument("--ids", type = int, default = 2, help = "number of ids")
+    parser.add_argument("--resizeval", type = float, default = 1)
+    parser.add_argument("--steps", type = int, default = 200, help = "navigation steps")
+    parser.add_argument("--repeats", type = int, default = 5)
+    parser.add_argument("--formats", nargs = "+", default = ["csv", "npz"],
+                        choices = sorted(FORMATS))
+    parser.add_argument("--workdir", help = "directory for the video and datafiles")
+    parser.add_argument("--json", help = "file to write the results to")
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix = "mantrack_bench_")
+    if not os.path.isdir(workdir):
+        os.makedirs(workdir)
+    vidfile = os.path.join(workdir, "synthetic_%dx%d_%d_%s%s" % (args.width,
+                           args.height, args.frames, args.codec, args.ext))
+
+    tstart = time.time()
+    if not os.path.isfile(vidfile):
+        make_video(vidfile, args.frames, args.width, args.height, args.codec, args.fps)
+    print("Video ready in", round(time.time() - tstart, 1), "s..")
+
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    profiler = LatencyProfiler()
+    tm = None
+    try:
+        ids = [str(i + 1) for i in range(args.ids)]
+        tm = mantrack.Track_Manual(os.path.basename(vidfile), fileaction = "replace",
+                                   ids = ids, ptypes = ["c","f"], autosave = None,
+                                   resizeval = args.resizeval,
+                                   asyncdecode = False)
+        bench_navigation(profiler, tm, args.steps)
+        fill_store(tm.store, ids, tm.subcolumns, every = 2)
+        bench_draw(profiler, tm, args.steps)
+        bench_data(profiler, workdir, args.frames, ids, tm.columns,
+                   args.repeats, args.formats)
+        bench_savedat(profiler, tm, args.repeats)
+    finally:
+        if tm is not None:
+            # remove the journal and datafile, such that a next run in the
+            # same workdir does not recover or append to them
+            tm.close()
+            tm.journal.close(True)
+            if os.path.isfile(tm.datafile):
+                os.remove(tm.datafile)
+        os.chdir(cwd)
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors = True)
+
+    profiler.report()
+
+    results = {"meta": {"mantrack": mantrack.__version__,
+                        "python": platform.python_version(),
+                        "platform": platform.platform(),
+                        "opencv": cv2.__version__,
+                        "numpy": np.__version__,
+                        "pandas": pd.__version__,
+                        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+                        "params": vars(args)},
+               "results": profiler.summary()["stages"]}
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent = 2)
+        print("Results written to "+args.json+"..")
+
+
+if __name__ == "__main__":
+    main()
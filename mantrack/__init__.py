@@ -5,5 +5,54 @@
 # Jolles. Do not distribute!                   #
 ################################################
 
+# The submodules are only imported on first use, such that importing
+# mantrack for the version or the data functions does not load OpenCV,
+# pandas or animlab. This relies on the module level __getattr__ of
+# Python 3.7 and newer.
+
+import importlib
+
 from .__version__ import __version__
-from .mantrack import *
+
+
+_LAZY = {"Track_Manual": "mantrack",
+         "TrackSession": "session",
+         "load_data": "datastore",
+         "save_data": "datastore",
+         "convert_data": "datastore",
+         "validate_data": "batch",
+         "merge_data": "batch",
+         "process_file": "batch",
+         "batch_process": "batch",
+         "analyse_data": "analysis",
+         "analyse_file": "analysis",
+         "analyse_files": "analysis"}
+
+_SUBMODULES = ["analysis", "assist", "batch", "datastore", "frames",
+               "interpolate", "mantrack", "profiler", "render", "session"]
+
+__all__ = ["__version__"] + sorted(_LAZY)
+
+
+def __getattr__(name):
+
+    if name in _SUBMODULES:
+        return importlib.import_module("." + name, __name__)
+    if name in _LAZY:
+        module = importlib.import_module("." + _LAZY[name], __name__)
+    elif name.startswith("__"):
+        raise AttributeError("module 'mantrack' has no attribute '" + name + "'")
+    else:
+        # names that used to be exported with "from .mantrack import *"
+        module = importlib.import_module(".mantrack", __name__)
+        if not hasattr(module, name):
+            raise AttributeError("module 'mantrack' has no attribute '" + name + "'")
+    value = getattr(module, name)
+    globals()[name] = value
+
+    return value
+
+
+def __dir__():
+
+    return sorted(set(globals()) | set(_LAZY) | set(_SUBMODULES))
@@ -0,0 +1,12 @@
+#! /usr/bin/env python
+################################################
+# This is the stand alone version of Mantrack, #
+# a tool from the AnimTrack package by J.W.    #
+# Jolles. Do not distribute!                   #
+################################################
+
+import sys
+
+from .batch import main
+
+sys.exit(main())
@@ -5,6 +5,6 @@
 # Jolles. Do not distribute!                   #
 ################################################
 
-__version__ = "4.0.0"
+__version__ = "5.0.0"
 
 # For documentation of all changes, see CHANGELOG
@@ -0,0 +1,237 @@
+#! /usr/bin/env python
+################################################
+# This is the stand alone version of Mantrack, #
+# a tool from the AnimTrack package by J.W.    #
+# Jolles. Do not distribute!                   #
+################################################
+
+from __future__ import print_function
+
+import os
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+from .datastore import AnnotationStore, load_data
+from .batch import run_pool
+
+
+def _points(store, columns):
+
+    """Returns the coordinates of a point type as a (frames, ids, 2) array"""
+
+    if not all(col in store.colloc for col in columns):
+        return None
+
+    return store.values[:, :, store.colinds(columns)]
+
+
+def speeds(store, fps, columns = ["x","y"]):
+
+    """
+    Returns the speed of each id in pixels per second as a (frames, ids)
+    array, computed between the consecutive tracked points of each id as
+    the distance divided by the time between their frames. The speed is
+    set at the later point and is NaN where the point is missing and at
+    the first point of an id
+    """
+
+    xy = _points(store, columns)
+    speed = np.full(xy.shape[:2], np.nan)
+    for idind in range(xy.shape[1]):
+        rows = np.flatnonzero(~np.isnan(xy[:, idind]).any(axis = 1))
+        dist = np.hypot(*np.diff(xy[rows, idind], axis = 0).T)
+        speed[rows[1:], idind] = dist / (np.diff(rows) / float(fps))
+
+    return speed
+
+
+def headings(store):
+
+    """
+    Returns the heading of each id in degrees (0-360, counterclockwise from
+    the x axis as seen in the video) as a (frames, ids) array. The heading
+    is the direction from the back to the front point, or when one of them
+    was not tracked, from the back or to the front via the centre point
+    """
+
+    front = _points(store, ["fx","fy"])
+    back = _points(store, ["bx","by"])
+    centre = _points(store, ["x","y"])
+    if front is None and back is None:
+        return None
+
+    if front is None:
+        front = centre
+    elif back is None:
+        back = centre
+    elif centre is not None:
+        front = np.where(np.isnan(front).any(axis = 2)[:, :, None], centre, front)
+        back = np.where(np.isnan(back).any(axis = 2)[:, :, None], centre, back)
+    if front is None or back is None:
+        return None
+
+    d = front - back
+    heading = np.degrees(np.arctan2(-d[:, :, 1], d[:, :, 0])) % 360
+    heading[(d == 0).all(axis = 2)] = np.nan
+
+    return heading
+
+
+def distances(store, columns = ["x","y"]):
+
+    """
+    Returns a dataframe with the distance in pixels between each pair of
+    ids in every frame
+    """
+
+    xy = _points(store, columns)
+    frames = np.arange(store.first, store.last + 1)
+    dfs = []
+    for i, j in combinations(range(len(store.ids)), 2):
+        dfs.append(pd.DataFrame({"frame": frames, "id1": store.ids[i],
+                                 "id2": store.ids[j],
+                                 "distance": np.hypot(*(xy[:, i] - xy[:, j]).T)}))
+    if len(dfs) == 0:
+        return pd.DataFrame(columns = ["frame","id1","id2","distance"])
+
+    return pd.concat(dfs, ignore_index = True)
+
+
+def bouts(store, statevar, fps, fill = True):
+
+    """
+    Returns a dataframe with the bouts of each id in each state, with their
+    first and last frame and duration in seconds. As states are normally
+    only coded when they change, the state is carried forward to the frames
+    without a state, unless fill is False
+    """
+
+    states = store.values[:, :, store.colinds([statevar])[0]].copy()
+    nframes = states.shape[0]
+    if fill:
+        inds = np.where(np.isnan(states), 0, np.arange(nframes)[:, None])
+        states = np.take_along_axis(states, np.maximum.accumulate(inds, axis = 0), axis = 0)
+
+    dfs = []
+    for idind, id in enumerate(store.ids):
+        state = states[:, idind]
+        missing = np.isnan(state)
+        change = (state[1:] != state[:-1]) & ~(missing[1:] & missing[:-1])
+        starts = np.r_[0, np.flatnonzero(change) + 1]
+        stops = np.r_[starts[1:], nframes] - 1
+        keep = ~missing[starts]
+        starts, stops = starts[keep], stops[keep]
+        dfs.append(pd.DataFrame({"id": id, statevar: state[starts],
+                                 "start": starts + store.first,
+                                 "stop": stops + store.first,
+                                 "nframes": stops - starts + 1,
+                                 "duration": (stops - starts + 1) / float(fps)}))
+
+    return pd.concat(dfs, ignore_index = True)
+
+
+def analyse_data(data, fps, statevar = None, columns = ["x","y"]):
+
+    """
+    Computes the speeds, headings, inter-individual distances and state
+    bouts of tracking data in the datafile layout
+
+    Parameters
+    ----------
+    data : dataframe; no default
+        The tracking data, with frame and id columns and the x,y, fx,fy
+        and/or bx,by columns of the point types.
+    fps : float; no default
+        Frame rate of the video.
+    statevar : str; default = None
+        Name of the state variable for which to compute the bouts.
+    columns : list; default = ["x","y"]
+        The columns of the point type used for speeds and distances.
+
+    Returns
+    -------
+    results : dict; dataframes with the "metrics" (speed and heading) per
+        frame and id, the "distances" and the "bouts"
+    """
+
+    store = AnnotationStore.from_df(data)
+    frames = np.repeat(np.arange(store.first, store.last + 1), len(store.ids))
+    metrics = pd.DataFrame({"frame": frames,
+                            "id": np.tile(np.asarray(store.ids, dtype = object),
+                                          store.last - store.first + 1)})
+    results = {"metrics": metrics}
+    if _points(store, columns) is not None:
+        metrics["speed"] = speeds(store, fps, columns).ravel()
+        results["distances"] = distances(store, columns)
+    heading = headings(store)
+    if heading is not None:
+        metrics["heading"] = heading.ravel()
+    if statevar is not None:
+        results["bouts"] = bouts(store, statevar, fps)
+
+    return results
+
+
+def analyse_file(datafile, fps = None, vidfile = None, statevar = None,
+                 columns = ["x","y"], outdir = None):
+
+    """
+    Analyses a datafile and saves the results next to it (or in outdir) as
+    csv files ending with _metrics, _distances and _bouts. The frame rate
+    is read from the video if not provided. Returns the saved files
+    """
+
+    if fps is None:
+        import cv2
+        cap = cv2.VideoCapture(vidfile)
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        cap.release()
+        if not fps > 0:
+            raise IOError("Could not get the frame rate of "+str(vidfile))
+
+    results = analyse_data(load_data(datafile), fps, statevar, columns)
+    dirname, filename = os.path.split(datafile)
+    base = os.path.join(dirname if outdir is None else outdir,
+                        os.path.splitext(filename)[0])
+    outfiles = []
+    for name, df in sorted(results.items()):
+        outfiles.append(base + "_" + name + ".csv")
+        df.to_csv(outfiles[-1], index = False)
+
+    return outfiles
+
+
+def analyse_files(datafiles, fps = None, vidfiles = None, nprocs = None,
+                  **kwargs):
+
+    """
+    Analyses many datafiles with analyse_file on a pool of processes
+
+    Parameters
+    ----------
+    datafiles : list; no default
+        The datafiles to analyse.
+    fps : float; default = None
+        Frame rate of the videos, if the same for all videos.
+    vidfiles : list; default = None
+        The videos of the datafiles, to get the frame rates from.
+    nprocs : int; default = None
+        Number of processes to use, by default the number of cpus.
+    **kwargs
+        The statevar, columns and outdir arguments of analyse_file.
+
+    Returns
+    -------
+    outfiles : list; the saved files of each datafile
+    """
+
+    if vidfiles is None:
+        vidfiles = [None] * len(datafiles)
+    if kwargs.get("outdir") is not None and not os.path.isdir(kwargs["outdir"]):
+        os.makedirs(kwargs["outdir"])
+    jobs = [(analyse_file, (datafile, fps, vidfile), kwargs)
+            for datafile, vidfile in zip(datafiles, vidfiles)]
+
+    return run_pool(jobs, nprocs)
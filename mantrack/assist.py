@@ -0,0 +1,124 @@
+#! /usr/bin/env python
+################################################
+# This is the stand alone version of Mantrack, #
+# a tool from the AnimTrack package by J.W.    #
+# Jolles. Do not distribute!                   #
+################################################
+
+from __future__ import print_function
+
+import cv2
+import numpy as np
+
+
+METHODS = ["template", "flow"]
+
+
+def _gray(img):
+
+    return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+
+
+def _box(pt, radius, shape):
+
+    """Returns the (x1, y1, x2, y2) box around a point, clipped to a frame"""
+
+    height, width = shape[:2]
+    return (max(pt[0] - radius, 0), max(pt[1] - radius, 0),
+            min(pt[0] + radius + 1, width), min(pt[1] + radius + 1, height))
+
+
+class PointAssist:
+
+    """
+    Proposes the location of a point in a frame based on its location in the
+    previous frame, either by matching a patch around the previous point
+    within a small search window or with sparse optical flow. Only a small
+    region of interest around the point is ever processed, such that a
+    suggestion takes a few milliseconds independent of the frame size.
+
+    Parameters
+    ----------
+    method : ["template","flow"]; default = "template"
+        Method used to find the point, either normalized cross-correlation
+        template matching or pyramidal Lucas-Kanade optical flow.
+    patchsize : int; default = 21
+        Size in pixels of the patch around the point that is matched.
+    searchradius : int; default = 20
+        Maximum distance in pixels the point may have moved in either
+        direction between the two frames.
+    minscore : float; default = 0.5
+        Minimum correlation of a template match for it to be suggested.
+
+    Returns
+    -------
+    PointAssist : class; the PointAssist class
+    """
+
+    def __init__(self, method = "template", patchsize = 21, searchradius = 20,
+                 minscore = 0.5):
+
+        assert method in METHODS,"Assist method "+str(method)+" not supported, exiting.."
+        self.method = method
+        self.half = max(int(patchsize / 2), 1)
+        self.searchradius = max(int(searchradius), 1)
+        self.minscore = minscore
+
+
+    def _template(self, prevframe, frame, pt):
+
+        px1, py1, px2, py2 = _box(pt, self.half, prevframe.shape)
+        sx1, sy1, sx2, sy2 = _box(pt, self.half + self.searchradius, frame.shape)
+        patch = _gray(prevframe[py1:py2, px1:px2])
+        region = _gray(frame[sy1:sy2, sx1:sx2])
+        if (patch.shape[0] < 3 or patch.shape[1] < 3 or
+            region.shape[0] < patch.shape[0] or region.shape[1] < patch.shape[1]):
+            return None
+
+        result = cv2.matchTemplate(region, patch, cv2.TM_CCOEFF_NORMED)
+        _, score, _, (mx, my) = cv2.minMaxLoc(result)
+        if not score >= self.minscore:
+            return None
+
+        return (sx1 + mx + pt[0] - px1, sy1 + my + pt[1] - py1)
+
+
+    def _flow(self, prevframe, frame, pt):
+
+        x1, y1, x2, y2 = _box(pt, self.half + self.searchradius, frame.shape)
+        prevregion = _gray(prevframe[y1:y2, x1:x2])
+        region = _gray(frame[y1:y2, x1:x2])
+        winsize = 2 * self.half + 1
+        if min(region.shape) < winsize:
+            return None
+
+        p0 = np.array([[[pt[0] - x1, pt[1] - y1]]], np.float32)
+        p1, status, _ = cv2.calcOpticalFlowPyrLK(prevregion, region, p0, None,
+                                                 winSize = (winsize, winsize),
+                                                 maxLevel = 2)
+        if p1 is None or not status[0][0]:
+            return None
+        x, y = p1[0][0]
+        if abs(x + x1 - pt[0]) > self.searchradius or abs(y + y1 - pt[1]) > self.searchradius:
+            return None
+
+        return (int(round(x + x1)), int(round(y + y1)))
+
+
+    def suggest(self, prevframe, frame, pt):
+
+        """
+        Returns the suggested location in frame of the point pt in prevframe,
+        or None if the point could not be found within the search window
+        """
+
+        if prevframe is None or frame is None or pt is None:
+            return None
+        if prevframe.shape != frame.shape:
+            return None
+        pt = (int(pt[0]), int(pt[1]))
+
+        if self.method == "flow":
+            return self._flow(prevframe, frame, pt)
+
+        return self._template(prevframe, frame, pt)
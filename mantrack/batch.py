@@ -0,0 +1,329 @@
+#! /usr/bin/env python
+################################################
+# This is the stand alone version of Mantrack, #
+# a tool from the AnimTrack package by J.W.    #
+# Jolles. Do not distribute!                   #
+################################################
+
+from __future__ import print_function
+
+import os
+import sys
+import argparse
+import multiprocessing
+
+import pandas as pd
+
+from .datastore import AnnotationStore, FORMATS, load_data, replace_data
+
+
+def crop_range(store, start = None, stop = None):
+
+    """
+    Returns the first and last frame to crop a store to, which is the range
+    of frames with tracked points unless start and/or stop are provided, or
+    None if the store has no tracked points
+    """
+
+    frames = list(store.tracked_frames())
+    if len(frames) == 0:
+        return None
+    if len(frames) < 3:
+        frames = [store.first, store.last]
+    frames = [frames[0], frames[-1]]
+    if start is not None:
+        frames[0] = start
+    if stop is not None:
+        frames[1] = stop
+
+    return frames[0], frames[1]
+
+
+def validate_data(data, columns = None, ids = None):
+
+    """
+    Checks a tracking dataframe and returns a list of the problems found,
+    which is empty when the data is valid
+
+    Parameters
+    ----------
+    data : dataframe; no default
+        The tracking data, in the datafile layout.
+    columns : list; default = None
+        Data columns that should be present, e.g. ["x","y","fx","fy"].
+    ids : list; default = None
+        Animal IDs that should be present.
+
+    Returns
+    -------
+    problems : list; descriptions of the problems found
+    """
+
+    problems = []
+    missing = [col for col in ["frame","id"] if col not in data.columns]
+    if len(missing) > 0:
+        return ["Column(s) "+", ".join(missing)+" not in data"]
+    if len(data) == 0:
+        return ["Data is empty"]
+
+    if columns is not None:
+        missing = [col for col in columns if col not in data.columns]
+        if len(missing) > 0:
+            problems.append("Column(s) "+", ".join(missing)+" not in data")
+    if ids is not None:
+        dataids = set(str(id) for id in pd.unique(data["id"]))
+        missing = [str(id) for id in ids if str(id) not in dataids]
+        if len(missing) > 0:
+            problems.append("ID(s) "+", ".join(missing)+" not in data")
+
+    ndup = int(data.duplicated(["frame","id"]).sum())
+    if ndup > 0:
+        problems.append(str(ndup)+" duplicate frame/id row(s)")
+    frames = pd.unique(data["frame"])
+    nmissing = int(frames.max() - frames.min() + 1 - len(frames))
+    if nmissing > 0:
+        problems.append(str(nmissing)+" frame(s) missing from the frame range")
+
+    return problems
+
+
+def merge_data(datas):
+
+    """
+    Merges tracking dataframes into one, with one row per frame per id. Where
+    multiple dataframes hold a value, the value of the first one is kept
+    """
+
+    merged = None
+    for data in datas:
+        data = data.set_index(["frame","id"])
+        merged = data if merged is None else merged.combine_first(data)
+
+    return merged.sort_index().reset_index()
+
+
+def process_data(data, crop = False, firstframe = None, lastframe = None):
+
+    """
+    Crops tracking data to the tracked frames (crop), to a first and/or last
+    frame, or both, like the interactive datacrop option and the "[" and "]"
+    keys. Returns the data unchanged when nothing is to be cropped
+    """
+
+    if not crop and firstframe is None and lastframe is None:
+        return data
+    store = AnnotationStore.from_df(data)
+    if crop:
+        frames = crop_range(store, firstframe, lastframe)
+    else:
+        frames = (store.first if firstframe is None else firstframe,
+                  store.last if lastframe is None else lastframe)
+    if frames is None:
+        return data
+    store.crop(frames[0], frames[1])
+
+    return store.to_df()
+
+
+def process_file(datafiles, outfile = None, crop = False, firstframe = None,
+                 lastframe = None, columns = None, ids = None):
+
+    """
+    Loads, merges, validates and crops one or multiple datafiles, and saves
+    the result if an outfile is provided and the data is valid
+
+    Parameters
+    ----------
+    datafiles : str or list; no default
+        The datafile to process, or a list of datafiles to merge.
+    outfile : str; default = None
+        The file to save the result to, in the format of its extension. The
+        file is replaced with a complete copy, such that it is never partly
+        written.
+    crop : boolean; default = False
+        If the data should be cropped to the first and last tracked frame.
+    firstframe : int; default = None
+        Frame before which the data should be cropped.
+    lastframe : int; default = None
+        Frame after which the data should be cropped.
+    columns : list; default = None
+        Data columns that should be present.
+    ids : list; default = None
+        Animal IDs that should be present.
+
+    Returns
+    -------
+    result : dict; the files, problems and resulting frame range
+    """
+
+    if not isinstance(datafiles, (list, tuple)):
+        datafiles = [datafiles]
+    result = {"datafiles": list(datafiles), "outfile": None, "problems": []}
+
+    try:
+        datas = [load_data(datafile) for datafile in datafiles]
+        for datafile, data in zip(datafiles, datas):
+            problems = validate_data(data, columns, ids)
+            result["problems"] += [os.path.split(datafile)[1]+": "+problem
+                                   for problem in problems]
+        if len(result["problems"]) > 0:
+            return result
+        data = datas[0] if len(datas) == 1 else merge_data(datas)
+        data = process_data(data, crop, firstframe, lastframe)
+    except Exception as e:
+        result["problems"].append(type(e).__name__+": "+str(e))
+        return result
+
+    result["first"] = int(data["frame"].min())
+    result["last"] = int(data["frame"].max())
+    if outfile is not None:
+        replace_data(data, outfile)
+        result["outfile"] = outfile
+
+    return result
+
+
+def _call(job):
+
+    function, args, kwargs = job
+    return function(*args, **kwargs)
+
+
+def run_pool(jobs, nprocs = None):
+
+    """
+    Runs a list of (function, args, kwargs) jobs on a pool of processes and
+    returns their results in order. The functions need to be importable
+    """
+
+    nprocs = min(nprocs or multiprocessing.cpu_count(), len(jobs))
+    if nprocs <= 1:
+        return [_call(job) for job in jobs]
+    pool = multiprocessing.Pool(nprocs)
+    try:
+        results = pool.map(_call, jobs, chunksize = 1)
+    finally:
+        pool.close()
+        pool.join()
+
+    return results
+
+
+def batch_process(datafiles, outdir = None, suffix = "", fileformat = None,
+                  merge = None, nprocs = None, validate = False,
+                  overwrite = False, **kwargs):
+
+    """
+    Processes many datafiles at once on a pool of processes, without opening
+    any windows
+
+    Parameters
+    ----------
+    datafiles : list; no default
+        The datafiles to process.
+    outdir : str; default = None
+        Directory to save the processed files to. By default they are saved
+        next to the original datafiles.
+    suffix : str; default = ""
+        Suffix added to the names of the processed files. Note that without
+        an outdir and suffix the datafiles are replaced, which requires
+        overwrite.
+    fileformat : ["csv","npz","feather","parquet"]; default = None
+        Format to save the processed files in. By default the format of the
+        original datafile is kept.
+    merge : str; default = None
+        If provided, all datafiles are merged into a single file with this
+        name instead of being processed one by one.
+    nprocs : int; default = None
+        Number of processes to use, by default the number of cpus.
+    validate : boolean; default = False
+        If the datafiles should only be validated, without saving.
+    overwrite : boolean; default = False
+        If processed files may replace the original datafiles. Otherwise a
+        ValueError is raised before anything is processed.
+    **kwargs
+        The crop, firstframe, lastframe, columns and ids arguments of
+        process_file.
+
+    Returns
+    -------
+    results : list; the result of process_file for each job
+    """
+
+    inputs = set(os.path.abspath(datafile) for datafile in datafiles)
+    if merge is not None:
+        if not validate and not overwrite and os.path.abspath(merge) in inputs:
+            raise ValueError("Merging into "+merge+" would replace one of the datafiles, use overwrite..")
+        return [process_file(datafiles, None if validate else merge, **kwargs)]
+
+    jobs = []
+    for datafile in datafiles:
+        outfile = None
+        if not validate:
+            dirname, filename = os.path.split(datafile)
+            base, ext = os.path.splitext(filename)
+            ext = ext if fileformat is None else FORMATS[fileformat]
+            outfile = os.path.join(dirname if outdir is None else outdir,
+                                   base + suffix + ext)
+            if not overwrite and os.path.abspath(outfile) in inputs:
+                raise ValueError("Processing would replace "+outfile+", use an outdir or suffix, or overwrite..")
+        jobs.append((process_file, (datafile, outfile), kwargs))
+
+    if outdir is not None and not validate and not os.path.isdir(outdir):
+        os.makedirs(outdir)
+
+    return run_pool(jobs, nprocs)
+
+
+def main(argv = None):
+
+    """Command line interface of batch_process, see --help"""
+
+    parser = argparse.ArgumentParser(prog = "mantrack-batch",
+        description = "Validate, crop, merge and convert mantrack datafiles")
+    parser.add_argument("datafiles", nargs = "+", help = "datafiles to process")
+    parser.add_argument("-o", "--outdir", help = "directory for the processed files")
+    parser.add_argument("-s", "--suffix", default = "", help = "suffix for the processed files")
+    parser.add_argument("-f", "--format", dest = "fileformat", choices = sorted(FORMATS),
+                        help = "format of the processed files")
+    parser.add_argument("-m", "--merge", metavar = "OUTFILE",
+                        help = "merge all datafiles into a single file")
+    parser.add_argument("-c", "--crop", action = "store_true",
+                        help = "crop to the first and last tracked frame")
+    parser.add_argument("--firstframe", type = int, help = "frame to crop before")
+    parser.add_argument("--lastframe", type = int, help = "frame to crop after")
+    parser.add_argument("--columns", nargs = "+", help = "columns that should be present")
+    parser.add_argument("--ids", nargs = "+", help = "ids that should be present")
+    parser.add_argument("--validate", action = "store_true",
+                        help = "only validate the datafiles")
+    parser.add_argument("--overwrite", action = "store_true",
+                        help = "allow replacing the original datafiles")
+    parser.add_argument("-j", "--nprocs", type = int, help = "number of processes")
+    args = parser.parse_args(argv)
+
+    try:
+        results = batch_process(args.datafiles, args.outdir, args.suffix,
+                                args.fileformat, args.merge, args.nprocs,
+                                args.validate, args.overwrite, crop = args.crop,
+                                firstframe = args.firstframe,
+                                lastframe = args.lastframe,
+                                columns = args.columns, ids = args.ids)
+    except ValueError as e:
+        parser.error(str(e))
+
+    nfailed = 0
+    for result in results:
+        name = ", ".join(os.path.split(f)[1] for f in result["datafiles"])
+        if len(result["problems"]) > 0:
+            nfailed += 1
+            print(name, "| FAILED |", "; ".join(result["problems"]))
+        else:
+            saved = "" if result["outfile"] is None else " | saved to "+result["outfile"]
+            print(name, "| OK | frames", str(result["first"])+":"+str(result["last"])+saved)
+    print(len(results)-nfailed, "of", len(results), "OK..")
+
+    return 1 if nfailed > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1182 @@
+#! /usr/bin/env python
+################################################
+# This is the stand alone version of Mantrack, #
+# a tool from the AnimTrack package by J.W.    #
+# Jolles. Do not distribute!                   #
+################################################
+
+from __future__ import print_function
+
+import os
+import json
+import time
+import errno
+import threading
+from bisect import bisect_left, bisect_right, insort
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+FORMATS = {"csv": ".csv", "npz": ".npz", "feather": ".feather",
+           "parquet": ".parquet"}
+
+
+def get_format(datafile):
+
+    """Returns the storage format of a datafile based on its extension"""
+
+    ext = os.path.splitext(datafile)[1].lower()
+    formats = dict((v, k) for k, v in FORMATS.items())
+    if ext not in formats:
+        raise ValueError("Datafile format '"+ext+"' not supported, use one of "+", ".join(FORMATS.values()))
+
+    return formats[ext]
+
+
+def _check_pyarrow():
+
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("Package pyarrow is required for the feather and parquet formats. To install: pip install pyarrow")
+
+
+def load_data(datafile):
+
+    """
+    Loads a datafile in any of the supported formats (csv, npz, feather or
+    parquet) as a dataframe with the frame and id columns first
+    """
+
+    fileformat = get_format(datafile)
+    if fileformat == "csv":
+        return pd.read_csv(datafile, header = 0)
+    if fileformat == "npz":
+        with np.load(datafile, allow_pickle = False) as dat:
+            columns = list(dat["columns"])
+            return pd.DataFrame(dict((col, dat["col_"+col]) for col in columns),
+                                columns = columns)
+    _check_pyarrow()
+    if fileformat == "feather":
+        return pd.read_feather(datafile)
+    return pd.read_parquet(datafile)
+
+
+def save_data(data, datafile, fileformat = None):
+
+    """
+    Saves a dataframe with typed columns to a datafile in any of the
+    supported formats. The format follows from the extension of the
+    datafile, unless provided
+    """
+
+    fileformat = get_format(datafile) if fileformat is None else fileformat
+    if fileformat == "csv":
+        data.to_csv(datafile, index = False)
+        return
+    data = data.reset_index(drop = True)
+    data["frame"] = data["frame"].astype(np.int64)
+    ids = np.asarray(data["id"], dtype = object)
+    numeric = all(isinstance(id, (int, np.integer)) for id in ids)
+    ids = ids.astype(np.int64) if numeric else ids.astype(str)
+    if fileformat == "npz":
+        cols = dict(("col_"+col, data[col].to_numpy()) for col in data.columns)
+        cols["col_id"] = ids
+        with open(datafile, "wb") as f:
+            np.savez(f, columns = np.array(list(data.columns)), **cols)
+        return
+    _check_pyarrow()
+    data["id"] = ids
+    if fileformat == "feather":
+        data.to_feather(datafile)
+    else:
+        data.to_parquet(datafile, index = False)
+
+
+def convert_data(infile, outfile):
+
+    """Converts a datafile to another format, e.g. from csv to parquet"""
+
+    save_data(load_data(infile), outfile)
+
+
+def journal_name(datafile, tag = None):
+
+    """
+    Returns the name of the edit journal that belongs to a datafile, with
+    an optional tag for sessions that share the datafile
+    """
+
+    return datafile + ("" if tag is None else "." + str(tag)) + ".journal"
+
+
+def find_journal(vidfile, dirname = ""):
+
+    """
+    Returns the datafile of a video that has a leftover journal with
+    unsaved edits, or None
+    """
+
+    vidname = os.path.splitext(os.path.basename(vidfile))[0]
+    for filename in sorted(os.listdir(dirname if dirname != "" else ".")):
+        if not filename.startswith(vidname) or ".journal" not in filename:
+            continue
+        datafile = os.path.join(dirname, filename[:filename.rindex(".journal")])
+        if os.path.splitext(datafile)[1] not in FORMATS.values():
+            continue
+        if EditJournal.source(journal_name(datafile)) == os.path.abspath(vidfile):
+            return datafile
+
+    return None
+
+
+def replace_data(data, datafile):
+
+    """
+    Saves a dataframe by replacing the datafile with a complete copy, such
+    that the datafile is never partly written, also when multiple processes
+    or threads save it at the same time
+    """
+
+    tempfile = datafile + "." + str(os.getpid()) + "_" + \
+               str(threading.current_thread().ident) + ".tmp"
+    save_data(data, tempfile, get_format(datafile))
+    os.replace(tempfile, datafile)
+
+
+def save_store(store, datafile):
+
+    """Writes a store to a datafile by replacing it with a complete copy"""
+
+    replace_data(store.to_df(), datafile)
+
+
+class AnnotationStore:
+
+    """
+    Holds manually tracked data in a dense array of frames x ids x columns
+    such that any value can be looked up and changed in constant time. The
+    data is only converted from and to the (csv) dataframe layout with
+    "frame" and "id" columns when it is loaded and saved.
+
+    Parameters
+    ----------
+    columns : list; no default
+        Names of the data columns, for example ["x","y","fx","fy"].
+    ids : list; no default
+        A list of animal IDs.
+    first : int; no default
+        The first frame of the data.
+    last : int; no default
+        The last frame of the data.
+
+    Returns
+    -------
+    AnnotationStore : class; the AnnotationStore class
+    """
+
+    def __init__(self, columns, ids, first, last):
+
+        self.columns = list(columns)
+        self.ids = list(ids)
+        self.first = int(first)
+        self.last = int(last)
+        self.values = np.full((self.last-self.first+1, len(self.ids),
+                               len(self.columns)), np.nan)
+        self._index()
+
+
+    def _index(self):
+
+        self.idloc = {}
+        for i, id in enumerate(self.ids):
+            self.idloc[str(id)] = i
+            self.idloc[id] = i
+        self.colloc = dict((col, i) for i, col in enumerate(self.columns))
+
+
+    @staticmethod
+    def _parse_df(data):
+
+        columns = [col for col in data.columns if col not in ["frame","id"]]
+        ids = list(pd.unique(data["id"]))
+        frames = data["frame"].values.astype(int)
+        idinds = pd.Categorical(data["id"], categories = ids).codes
+        values = data[columns].values.astype(float)
+
+        return columns, ids, frames, idinds, values
+
+
+    @classmethod
+    def from_df(cls, data):
+
+        """Creates a store from a dataframe with frame and id columns"""
+
+        columns, ids, frames, idinds, values = cls._parse_df(data)
+        store = cls(columns, ids, frames.min(), frames.max())
+        store.values[frames - store.first, idinds] = values
+
+        return store
+
+
+    def _rows_df(self, rows):
+
+        """Returns a dataframe of the rows in frame-major order"""
+
+        frameinds, idinds = np.divmod(rows, len(self.ids))
+        data = pd.DataFrame(self.values[frameinds, idinds],
+                            columns = self.columns, index = rows)
+        data.insert(0, "id", np.array(self.ids, dtype = object)[idinds])
+        data.insert(0, "frame", frameinds + self.first)
+
+        return data
+
+
+    def to_df(self):
+
+        """Returns the data as a dataframe with one row per frame per id"""
+
+        return self._rows_df(np.arange(self.values.shape[0] * len(self.ids)))
+
+
+    def select(self, locs):
+
+        """Returns a dataframe with the rows of a list of array locations"""
+
+        rows = [frameind * len(self.ids) + idind for frameind, idind in sorted(locs)]
+
+        return self._rows_df(np.array(rows, dtype = int))
+
+
+    def copy(self):
+
+        store = AnnotationStore(self.columns, self.ids, self.first, self.last)
+        store.values[:] = self.values
+
+        return store
+
+
+    def has_id(self, id):
+
+        return id in self.idloc or str(id) in self.idloc
+
+
+    def loc(self, frame, id):
+
+        """Returns the array location of a frame and id"""
+
+        return (int(frame) - self.first, self.idloc[id])
+
+
+    def colinds(self, columns):
+
+        return [self.colloc[col] for col in columns]
+
+
+    def get(self, loc, columns):
+
+        return self.values[loc][self.colinds(columns)]
+
+
+    def set(self, loc, columns, values):
+
+        self.values[loc + (self.colinds(columns),)] = values
+
+
+    def get_frames(self, frames, id, columns):
+
+        """Returns the values of an id for an array of frames (frames x columns)"""
+
+        rows = np.asarray(frames, dtype = int) - self.first
+
+        return self.values[rows[:, None], self.idloc[id], self.colinds(columns)]
+
+
+    def set_frames(self, frames, id, columns, values):
+
+        """Sets the values of an id for an array of frames at once"""
+
+        rows = np.asarray(frames, dtype = int) - self.first
+        self.values[rows[:, None], self.idloc[id], self.colinds(columns)] = values
+
+
+    def point(self, loc, columns, multiplier = 1):
+
+        """Returns a coordinate of integers or None if there is no point"""
+
+        x, y = self.get(loc, columns)
+        if x != x:
+            return None
+
+        return (int(x * multiplier), int(y * multiplier))
+
+
+    def add_columns(self, columns):
+
+        """Adds empty data columns to the store"""
+
+        columns = [col for col in columns if col not in self.columns]
+        empty = np.full(self.values.shape[:2] + (len(columns),), np.nan)
+        self.values = np.concatenate([self.values, empty], axis = 2)
+        self.columns += columns
+        self._index()
+
+
+    def track(self, id, columns, span = None):
+
+        """
+        Returns the frames and values of an id for which the first column
+        holds data, optionally only for the frames within span (first, last)
+        """
+
+        start, stop = 0, self.values.shape[0]
+        if span is not None:
+            start = min(max(span[0] - self.first, 0), stop)
+            stop = max(min(span[1] - self.first + 1, stop), start)
+        values = self.values[start:stop, self.idloc[id]][:, self.colinds(columns)]
+        inds = np.flatnonzero(~np.isnan(values[:, 0]))
+
+        return inds + self.first + start, values[inds]
+
+
+    def coords(self, id, columns, multiplier = 1, span = None):
+
+        """
+        Returns an array of coordinates of an id with a list of frames,
+        optionally only for the frames within span (first, last)
+        """
+
+        frames, values = self.track(id, columns, span)
+        coords = (values * multiplier).astype(np.int32).reshape((-1,1,2))
+
+        return coords, list(frames)
+
+
+    def tracked_frames(self, minvals = 2):
+
+        """Returns the frames in which any id has at least minvals values"""
+
+        nvals = (~np.isnan(self.values)).sum(axis = 2).max(axis = 1)
+
+        return np.flatnonzero(nvals >= minvals) + self.first
+
+
+    def crop(self, first, last):
+
+        """Crops the data to the provided first and last frames"""
+
+        first, last = max(int(first), self.first), min(int(last), self.last)
+        self.values = self.values[first-self.first:last-self.first+1]
+        self.first, self.last = first, last
+
+
+class SparseAnnotationStore(AnnotationStore):
+
+    """
+    Holds manually tracked data like the AnnotationStore, but only keeps the
+    rows (frame and id) that actually hold data, per id in a dictionary
+    keyed by frame. The dense layout with a row for every frame and id is
+    only created when the data is exported, such that memory use scales
+    with the number of tracked points rather than with video length. A
+    sorted index of the frames per id is kept alongside, such that a part
+    of a track is read without going through the whole track.
+
+    Parameters
+    ----------
+    columns : list; no default
+        Names of the data columns, for example ["x","y","fx","fy"].
+    ids : list; no default
+        A list of animal IDs.
+    first : int; no default
+        The first frame of the data.
+    last : int; no default
+        The last frame of the data.
+
+    Returns
+    -------
+    SparseAnnotationStore : class; the SparseAnnotationStore class
+    """
+
+    def __init__(self, columns, ids, first, last):
+
+        self.columns = list(columns)
+        self.ids = list(ids)
+        self.first = int(first)
+        self.last = int(last)
+        self.tracks = [{} for _ in self.ids]
+        self.frameinds = [[] for _ in self.ids]
+        self._index()
+
+
+    def _sortframes(self):
+
+        """Rebuilds the sorted frame index of each id from the tracks"""
+
+        self.frameinds = [sorted(track) for track in self.tracks]
+
+
+    @classmethod
+    def from_df(cls, data):
+
+        """Creates a store from a dataframe, keeping only rows with data"""
+
+        columns, ids, frames, idinds, values = cls._parse_df(data)
+        store = cls(columns, ids, frames.min(), frames.max())
+        for i in np.flatnonzero(~np.isnan(values).all(axis = 1)):
+            store.tracks[idinds[i]][frames[i] - store.first] = values[i].copy()
+        store._sortframes()
+
+        return store
+
+
+    def dense(self):
+
+        """Returns the data as a dense AnnotationStore"""
+
+        store = AnnotationStore(self.columns, self.ids, self.first, self.last)
+        for idind, track in enumerate(self.tracks):
+            for frameind, row in track.items():
+                store.values[frameind, idind] = row
+
+        return store
+
+
+    def _keys_df(self, keys):
+
+        """Returns a dataframe of the rows of a list of (frame, id) keys"""
+
+        keys = sorted(keys)
+        nan = np.full(len(self.columns), np.nan)
+        values = [self.tracks[idind].get(frameind, nan) for frameind, idind in keys]
+        data = pd.DataFrame(np.array(values).reshape(len(keys), len(self.columns)),
+                            columns = self.columns)
+        data.insert(0, "id", [self.ids[idind] for _, idind in keys])
+        data.insert(0, "frame", [frameind + self.first for frameind, _ in keys])
+
+        return data
+
+
+    def to_df(self):
+
+        """Returns the data as a dataframe with one row per frame per id"""
+
+        return self.dense().to_df()
+
+
+    def select(self, locs):
+
+        """Returns a dataframe with the rows of a list of array locations"""
+
+        return self._keys_df(locs)
+
+
+    def copy(self):
+
+        store = SparseAnnotationStore(self.columns, self.ids, self.first, self.last)
+        store.tracks = [dict((f, row.copy()) for f, row in track.items())
+                        for track in self.tracks]
+        store.frameinds = [list(frameinds) for frameinds in self.frameinds]
+
+        return store
+
+
+    def get(self, loc, columns):
+
+        row = self.tracks[loc[1]].get(loc[0])
+        if row is None:
+            return np.full(len(columns), np.nan)
+
+        return row[self.colinds(columns)]
+
+
+    def set(self, loc, columns, values):
+
+        track = self.tracks[loc[1]]
+        if loc[0] not in track:
+            track[loc[0]] = np.full(len(self.columns), np.nan)
+            insort(self.frameinds[loc[1]], loc[0])
+        track[loc[0]][self.colinds(columns)] = values
+
+
+    def get_frames(self, frames, id, columns):
+
+        """Returns the values of an id for an array of frames (frames x columns)"""
+
+        idind = self.idloc[id]
+        values = [self.get((frame - self.first, idind), columns) for frame in frames]
+
+        return np.array(values, dtype = float).reshape((len(values), len(columns)))
+
+
+    def set_frames(self, frames, id, columns, values):
+
+        """Sets the values of an id for an array of frames at once"""
+
+        idind = self.idloc[id]
+        values = np.asarray(values, dtype = float).reshape((len(frames), len(columns)))
+        for frame, row in zip(frames, values):
+            self.set((int(frame) - self.first, idind), columns, row)
+
+
+    def add_columns(self, columns):
+
+        """Adds empty data columns to the store"""
+
+        columns = [col for col in columns if col not in self.columns]
+        empty = np.full(len(columns), np.nan)
+        self.tracks = [dict((f, np.concatenate([row, empty])) for f, row in track.items())
+                       for track in self.tracks]
+        self.columns += columns
+        self._index()
+
+
+    def track(self, id, columns, span = None):
+
+        """
+        Returns the frames and values of an id for which the first column
+        holds data, optionally only for the frames within span (first, last)
+        """
+
+        idind = self.idloc[id]
+        track = self.tracks[idind]
+        frameinds = self.frameinds[idind]
+        cols = self.colinds(columns)
+        if span is not None:
+            frameinds = frameinds[bisect_left(frameinds, span[0] - self.first):
+                                  bisect_right(frameinds, span[1] - self.first)]
+        frames = np.array(frameinds, dtype = int) + self.first
+        values = np.array([track[f][cols] for f in frameinds])
+        values = values.reshape((len(frames), len(cols)))
+        inds = np.flatnonzero(~np.isnan(values[:, 0]))
+
+        return frames[inds], values[inds]
+
+
+    def tracked_frames(self, minvals = 2):
+
+        """Returns the frames in which any id has at least minvals values"""
+
+        frames = set()
+        for track in self.tracks:
+            for frameind, row in track.items():
+                if (~np.isnan(row)).sum() >= minvals:
+                    frames.add(frameind + self.first)
+
+        return np.array(sorted(frames), dtype = int)
+
+
+    def crop(self, first, last):
+
+        """Crops the data to the provided first and last frames"""
+
+        first, last = max(int(first), self.first), min(int(last), self.last)
+        shift = first - self.first
+        self.tracks = [dict((f - shift, row) for f, row in track.items()
+                            if 0 <= f - shift <= last - first)
+                       for track in self.tracks]
+        self._sortframes()
+        self.first, self.last = first, last
+
+
+def shared_name(datafile):
+
+    """Returns the name of the shared store that belongs to a datafile"""
+
+    return datafile + ".shared"
+
+
+def _alive(pid):
+
+    if pid <= 0:
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+
+    return True
+
+
+class SharedAnnotationStore(AnnotationStore):
+
+    """
+    An annotation store that is shared by multiple processes on the same
+    machine through a memory-mapped file, such that each process directly
+    sees the points tracked by the others. Each id is owned by a single
+    process, which is the only one that can change its data. The shared
+    file is created from the data of the first process that opens it and
+    is removed together with its lock file when the last process releases
+    it. Opening, ownership and releasing are serialized with the lock file.
+    Use open to create or join a shared store.
+
+    Parameters
+    ----------
+    sharedfile : str; no default
+        Name of the shared file, see shared_name.
+    owned : list; no default
+        The ids owned by this process.
+
+    Returns
+    -------
+    SharedAnnotationStore : class; the SharedAnnotationStore class
+    """
+
+    def __init__(self, sharedfile, owned):
+
+        with open(sharedfile + ".json") as f:
+            meta = json.load(f)
+        self.sharedfile = sharedfile
+        self.columns = meta["columns"]
+        self.ids = meta["ids"]
+        self.first = meta["first"]
+        self.last = meta["last"]
+        self._index()
+
+        nids = len(self.ids)
+        shape = (self.last-self.first+1, nids, len(self.columns))
+        self.values = np.memmap(sharedfile, np.float64, "r+", 0, shape)
+        offset = self.values.nbytes
+        self.counts, self.tokens, self.pids = [np.memmap(sharedfile, np.int64,
+                                               "r+", offset + i * 8 * nids, (nids,))
+                                               for i in range(3)]
+        self.token = int(os.urandom(7).hex(), 16) + 1
+        self.owned = set(self.idloc[id] for id in owned)
+        self.seen = 0
+
+
+    @staticmethod
+    def _lock(sharedfile):
+
+        if fcntl is None:
+            raise OSError("Shared stores are only supported on POSIX systems")
+        while True:
+            lockfile = open(sharedfile + ".lock", "a")
+            fcntl.flock(lockfile, fcntl.LOCK_EX)
+            # the lock file may have been removed while waiting for the lock
+            try:
+                if os.path.samestat(os.fstat(lockfile.fileno()),
+                                    os.stat(sharedfile + ".lock")):
+                    return lockfile
+            except OSError:
+                pass
+            lockfile.close()
+
+
+    @staticmethod
+    def _create(sharedfile, store):
+
+        tempfile = sharedfile + "." + str(os.getpid()) + ".tmp"
+        nids = len(store.ids)
+        values = np.memmap(tempfile, np.float64, "w+",
+                           shape = (store.values.nbytes // 8 + 3 * nids,))
+        values[:store.values.size] = store.values.ravel()
+        values[store.values.size:] = 0
+        values.flush()
+        del values
+        os.replace(tempfile, sharedfile)
+        meta = {"columns": store.columns, "first": int(store.first),
+                "last": int(store.last),
+                "ids": [id.item() if isinstance(id, np.generic) else id
+                        for id in store.ids]}
+        with open(tempfile, "w") as f:
+            json.dump(meta, f)
+        os.replace(tempfile, sharedfile + ".json")
+
+
+    def _active(self):
+
+        """Returns the indices of the ids that are owned by a live process"""
+
+        return [i for i in range(len(self.ids))
+                if self.tokens[i] != 0 and _alive(self.pids[i])]
+
+
+    @classmethod
+    def open(cls, sharedfile, store, owned):
+
+        """
+        Joins the shared store, or creates it from store if no other
+        process uses it, and takes ownership of the owned ids. Raises a
+        ValueError if an id is already owned by another process
+        """
+
+        lockfile = cls._lock(sharedfile)
+        try:
+            shared = None
+            if os.path.isfile(sharedfile) and os.path.isfile(sharedfile + ".json"):
+                shared = cls(sharedfile, [])
+                if len(shared._active()) == 0:
+                    shared = None
+            if shared is None:
+                cls._create(sharedfile, store)
+                shared = cls(sharedfile, [])
+
+            missing = [str(id) for id in owned if not shared.has_id(id)]
+            if len(missing) > 0:
+                raise ValueError("ID(s) "+", ".join(missing)+" not in shared data")
+            inds = [shared.idloc[id] for id in owned]
+            active = shared._active()
+            taken = [str(shared.ids[i]) for i in inds if i in active]
+            if len(taken) > 0:
+                raise ValueError("ID(s) "+", ".join(taken)+" already tracked in another session")
+            for i in inds:
+                shared.tokens[i] = shared.token
+                shared.pids[i] = os.getpid()
+            shared.owned = set(inds)
+            shared.changed()
+            shared.tokens.flush()
+            shared.pids.flush()
+        finally:
+            lockfile.close()
+
+        return shared
+
+
+    def release(self):
+
+        """
+        Gives up the ownership of the ids, and removes the shared file if no
+        other process uses it anymore
+        """
+
+        lockfile = self._lock(self.sharedfile)
+        try:
+            for i in self.owned:
+                if self.tokens[i] == self.token:
+                    self.tokens[i] = 0
+                    self.pids[i] = 0
+            self.owned = set()
+            self.values.flush()
+            if len(self._active()) == 0:
+                for filename in [self.sharedfile, self.sharedfile + ".json",
+                                 self.sharedfile + ".lock"]:
+                    if os.path.isfile(filename):
+                        os.remove(filename)
+        finally:
+            lockfile.close()
+
+
+    def owns(self, id):
+
+        return self.idloc[id] in self.owned
+
+
+    def set(self, loc, columns, values):
+
+        if loc[1] not in self.owned:
+            raise ValueError("ID "+str(self.ids[loc[1]])+" is tracked in another session")
+        self.values[loc + (self.colinds(columns),)] = values
+        self.counts[loc[1]] += 1
+
+
+    def set_frames(self, frames, id, columns, values):
+
+        idind = self.idloc[id]
+        if idind not in self.owned:
+            raise ValueError("ID "+str(id)+" is tracked in another session")
+        AnnotationStore.set_frames(self, frames, id, columns, values)
+        self.counts[idind] += 1
+
+
+    def add_columns(self, columns):
+
+        if any(col not in self.columns for col in columns):
+            raise ValueError("Columns cannot be added to a shared store")
+
+
+    def changed(self):
+
+        """Returns if other processes changed any data since the last call"""
+
+        seen = int(self.counts.sum()) - sum(int(self.counts[i]) for i in self.owned)
+        changed, self.seen = seen != self.seen, seen
+
+        return changed
+
+
+class EditLog:
+
+    """
+    A timestamped log of all edits made to the tracked data, with for each
+    edit the frame, id, columns and the old and new values. Edits are
+    grouped in actions that can be undone and redone, and the log is used to
+    determine which rows changed without comparing the full dataset.
+
+    Returns
+    -------
+    EditLog : class; the EditLog class
+    """
+
+    def __init__(self):
+
+        self.actions = []
+        self.undone = []
+
+
+    def record(self, frame, id, columns, old, new, newaction = True):
+
+        """
+        Records an edit of a frame, or of an array of frames with a row of
+        values per frame, by default as a new action that can be undone
+        """
+
+        frames = np.atleast_1d(np.asarray(frame, dtype = int))
+        shape = (len(frames), len(columns))
+        edit = {"time": time.time(), "frame": int(frames[0]), "frames": frames,
+                "id": id, "columns": list(columns),
+                "old": np.array(old, dtype = float).reshape(shape),
+                "new": np.array(new, dtype = float).reshape(shape)}
+        if newaction or len(self.actions) == 0:
+            self.actions.append([])
+        self.actions[-1].append(edit)
+        self.undone = []
+
+
+    def undo(self):
+
+        """Returns the edits of the last action, to revert in reverse order"""
+
+        if len(self.actions) == 0:
+            return []
+        action = self.actions.pop()
+        self.undone.append(action)
+
+        return action
+
+
+    def redo(self):
+
+        """Returns the edits of the last undone action, to apply in order"""
+
+        if len(self.undone) == 0:
+            return []
+        action = self.undone.pop()
+        self.actions.append(action)
+
+        return action
+
+
+    def revert(self, store):
+
+        """Reverts all edits on a store and clears the log"""
+
+        for action in reversed(self.actions):
+            for edit in reversed(action):
+                store.set_frames(edit["frames"], edit["id"], edit["columns"],
+                                 edit["old"])
+        self.actions = []
+        self.undone = []
+
+
+    def changed(self):
+
+        """Returns the (frame, id) of rows whose values differ from the start"""
+
+        net = {}
+        for action in self.actions:
+            for edit in action:
+                for frame, olds, news in zip(edit["frames"], edit["old"], edit["new"]):
+                    for col, old, new in zip(edit["columns"], olds, news):
+                        key = (int(frame), edit["id"], col)
+                        net[key] = (net[key][0] if key in net else old, new)
+        changed = set((frame, id) for (frame, id, _), (old, new) in net.items()
+                      if not (old == new or (old != old and new != new)))
+
+        return sorted(changed, key = lambda x: (x[0], str(x[1])))
+
+
+class EditJournal:
+
+    """
+    An append-only journal of edits to the tracked data, stored next to the
+    datafile with one line per edit after a header line with the video. The
+    file is only created with the first edit. Lines are written directly but
+    only synced to disk in batches, or only by the Autosaver while one runs,
+    such that recording an edit does not wait for the disk. After a crash the journal is replayed on
+    top of the datafile to recover all edits. The journal is written in
+    segments: when the data is compacted into the datafile the current
+    segment is rotated to "<journal>.1" and removed once the datafile has
+    been written.
+
+    Parameters
+    ----------
+    journalfile : str; no default
+        Name of the journal file.
+    vidfile : str; no default
+        Name of the video the edits belong to.
+    syncevery : int; default = 10
+        Number of edits after which the journal is synced to disk.
+
+    Returns
+    -------
+    EditJournal : class; the EditJournal class
+    """
+
+    def __init__(self, journalfile, vidfile, syncevery = 10):
+
+        self.journalfile = journalfile
+        self.vidfile = os.path.abspath(vidfile)
+        self.syncevery = max(int(syncevery), 1)
+        self.lock = threading.Lock()
+        self.file = None
+        self.pending = 0
+        self.nedits = 0
+        self.autosynced = False
+
+
+    @staticmethod
+    def source(journalfile):
+
+        """
+        Returns the video of a journal from its header, or None if the
+        journal holds no edits
+        """
+
+        for filename in [journalfile + ".1", journalfile]:
+            if not os.path.isfile(filename):
+                continue
+            with open(filename) as f:
+                lines = [f.readline() for _ in range(2)]
+            try:
+                header = json.loads(lines[0])
+                json.loads(lines[1])
+            except ValueError:
+                continue
+            if isinstance(header, dict) and "vidfile" in header:
+                return header["vidfile"]
+
+        return None
+
+
+    @staticmethod
+    def replay(journalfile, store):
+
+        """
+        Applies the edits of a journal to a store, returning their number.
+        Columns of the edits that are not in the store are added to it
+        """
+
+        nedits = 0
+        for filename in [journalfile + ".1", journalfile]:
+            if not os.path.isfile(filename):
+                continue
+            with open(filename) as f:
+                for line in f:
+                    try:
+                        edit = json.loads(line)
+                    except ValueError:
+                        break
+                    if "vidfile" in edit:
+                        continue
+                    if not store.has_id(edit["id"]):
+                        continue
+                    frames = np.atleast_1d(edit.get("frames", edit.get("frame")))
+                    values = np.array(edit["vals"], dtype = float)
+                    values = values.reshape((len(frames), len(edit["cols"])))
+                    inrange = (frames >= store.first) & (frames <= store.last)
+                    if not inrange.any():
+                        continue
+                    missing = [col for col in edit["cols"] if col not in store.colloc]
+                    if len(missing) > 0:
+                        store.add_columns(missing)
+                    store.set_frames(frames[inrange], edit["id"], edit["cols"],
+                                     values[inrange])
+                    nedits += 1
+
+        return nedits
+
+
+    def record(self, frame, id, columns, values):
+
+        """
+        Appends an edit of the columns of a single frame and id, or of an
+        array of frames with a row of values per frame
+        """
+
+        values = np.asarray(values, dtype = float)
+        edit = {"time": round(time.time(), 3),
+                "id": id if isinstance(id, (int, str)) else str(id),
+                "cols": list(columns)}
+        if np.ndim(frame) == 0:
+            edit["frame"] = int(frame)
+            values = np.atleast_1d(values)
+        else:
+            edit["frames"] = [int(f) for f in frame]
+            values = values.reshape((len(edit["frames"]), len(columns)))
+        edit["vals"] = np.where(np.isnan(values), None, values).tolist()
+        with self.lock:
+            if self.file is None:
+                self.file = open(self.journalfile, "a")
+                self.file.write(json.dumps({"vidfile": self.vidfile}) + "\n")
+            self.file.write(json.dumps(edit) + "\n")
+            self.pending += 1
+            self.nedits += 1
+            if self.pending >= self.syncevery and not self.autosynced:
+                self._sync()
+
+
+    def _sync(self):
+
+        if self.pending > 0:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.pending = 0
+
+
+    def sync(self):
+
+        """Writes all pending edits to disk"""
+
+        with self.lock:
+            self._sync()
+
+
+    def rotate(self):
+
+        """
+        Starts a new segment, returning the number of edits in the old. If
+        the old segment of a failed compaction is still there, the edits
+        are added to it
+        """
+
+        with self.lock:
+            nedits = self.nedits
+            if self.file is not None:
+                self._sync()
+                self.file.close()
+                self.file = None
+                rotated = self.journalfile + ".1"
+                if os.path.isfile(rotated):
+                    with open(self.journalfile) as f:
+                        f.readline()
+                        lines = f.read()
+                    with open(rotated, "a") as f:
+                        f.write(lines)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.remove(self.journalfile)
+                else:
+                    os.replace(self.journalfile, rotated)
+            self.nedits = 0
+
+        return nedits
+
+
+    def remove_rotated(self):
+
+        if os.path.isfile(self.journalfile + ".1"):
+            os.remove(self.journalfile + ".1")
+
+
+    def remove(self):
+
+        """Removes all segments of the journal"""
+
+        self.remove_rotated()
+        if os.path.isfile(self.journalfile):
+            os.remove(self.journalfile)
+
+
+    def close(self, remove = False):
+
+        """Closes the journal and optionally removes all its segments"""
+
+        with self.lock:
+            if self.file is not None:
+                self._sync()
+                self.file.close()
+                self.file = None
+        if remove:
+            self.remove()
+
+
+class Autosaver:
+
+    """
+    Periodically syncs an edit journal and compacts it into the datafile in
+    a background thread. While it runs the journal is only synced here.
+    Errors are reported and retried at the next interval
+
+    Parameters
+    ----------
+    journal : EditJournal; no default
+        The journal with the edits.
+    snapshot : function; no default
+        Function that returns a copy of the current data store. It is called
+        while holding the lock.
+    datafile : str; no default
+        Name of the datafile that is written when compacting.
+    lock : threading.Lock; no default
+        Lock that is held while the data is changed.
+    interval : float; default = 300
+        Number of seconds between compactions.
+    syncinterval : float; default = 2
+        Number of seconds between syncs of the journal.
+
+    Returns
+    -------
+    Autosaver : class; the Autosaver class
+    """
+
+    def __init__(self, journal, snapshot, datafile, lock, interval = 300,
+                 syncinterval = 2):
+
+        self.journal = journal
+        self.snapshot = snapshot
+        self.datafile = datafile
+        self.lock = lock
+        self.interval = interval
+        self.syncinterval = min(syncinterval, interval)
+        self.saved = False
+        self.stopped = threading.Event()
+        self.journal.autosynced = True
+        self.thread = threading.Thread(target = self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+
+    def _run(self):
+
+        lastsave = time.time()
+        while not self.stopped.wait(self.syncinterval):
+            try:
+                self.journal.sync()
+                if time.time() - lastsave >= self.interval:
+                    lastsave = time.time()
+                    self.compact()
+            except Exception as e:
+                print("Autosave failed: "+type(e).__name__+": "+str(e)+"..")
+
+
+    def compact(self):
+
+        """Writes the data to the datafile and drops the compacted edits"""
+
+        with self.lock:
+            if self.journal.nedits == 0:
+                return
+            store = self.snapshot()
+            nedits = self.journal.rotate()
+        try:
+            save_store(store, self.datafile)
+        except Exception:
+            # keep the rotated edits and compact them again next time
+            with self.journal.lock:
+                self.journal.nedits += nedits
+            raise
+        self.journal.remove_rotated()
+        self.saved = True
+
+
+    def stop(self):
+
+        self.stopped.set()
+        self.thread.join()
+        self.journal.autosynced = False
+        self.journal.sync()
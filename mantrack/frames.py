@@ -0,0 +1,527 @@
+#! /usr/bin/env python
+################################################
+# This is the stand alone version of Mantrack, #
+# a tool from the AnimTrack package by J.W.    #
+# Jolles. Do not distribute!                   #
+################################################
+
+from __future__ import print_function
+
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+
+def resize_frame(frame, resizeval = 1, dst = None):
+
+    """
+    Resizes a frame with the interpolation suited to the resize value. If
+    an array of the resized shape is provided as dst, the frame is resized
+    into it instead of into a new array
+    """
+
+    if resizeval == 1:
+        return frame
+    interpol = cv2.INTER_CUBIC if resizeval > 1 else cv2.INTER_AREA
+    return cv2.resize(frame, None, dst, fx = resizeval, fy = resizeval,
+                      interpolation = interpol)
+
+
+def index_name(vidfile, datafile):
+
+    """Returns the name of the index file that sits next to the datafile"""
+
+    vidname = os.path.splitext(os.path.basename(vidfile))[0]
+    return os.path.join(os.path.dirname(datafile), vidname + ".mtidx")
+
+
+def proxy_name(vidfile, datafile, resizeval = 1):
+
+    """Returns the name of the proxy video that sits next to the datafile"""
+
+    vidname = os.path.splitext(os.path.basename(vidfile))[0]
+    return os.path.join(os.path.dirname(datafile),
+                        vidname + "_proxy" + ("%g" % resizeval) + ".avi")
+
+
+def make_proxy(vidfile, proxyfile, resizeval = 1, quality = 95):
+
+    """
+    Transcodes a video to an all-intra (MJPG) proxy video at the working
+    resolution, in which every frame can be decoded without decoding any
+    other frame. An existing proxy is reused when it is newer than the
+    video. Returns the number of frames in the proxy
+    """
+
+    if os.path.isfile(proxyfile) and \
+       os.path.getmtime(proxyfile) >= os.path.getmtime(vidfile):
+        cap = cv2.VideoCapture(proxyfile)
+        fcount = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+        if fcount > 0:
+            return fcount
+
+    cap = cv2.VideoCapture(vidfile)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25
+    tempfile = os.path.splitext(proxyfile)[0] + ".tmp.avi"
+    writer = None
+    fcount = 0
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frame = resize_frame(frame, resizeval)
+        if writer is None:
+            height, width = frame.shape[:2]
+            writer = cv2.VideoWriter(tempfile, cv2.VideoWriter_fourcc(*"MJPG"),
+                                     fps, (width, height))
+            writer.set(cv2.VIDEOWRITER_PROP_QUALITY, quality)
+        writer.write(frame)
+        fcount += 1
+    cap.release()
+    if writer is None:
+        return 0
+    writer.release()
+    os.replace(tempfile, proxyfile)
+
+    return fcount
+
+
+class VideoIndex:
+
+    """
+    Holds the frame count, keyframe positions and timestamps of a video.
+    The index is built with a single pass over the video and can be stored
+    in a sidecar file such that it only needs to be built once per video
+
+    Parameters
+    ----------
+    fcount : int; no default
+        The number of frames in the video.
+    keyframes : array; no default
+        Sorted frame numbers (zero-based) of the keyframes in the video.
+        Empty when the keyframes could not be determined.
+    timestamps : array; no default
+        Presentation timestamps of the frames in milliseconds.
+    vidsize : int; default = None
+        Size of the video file in bytes when the index was built.
+    vidmtime : float; default = None
+        Modification time of the video file when the index was built.
+
+    Returns
+    -------
+    VideoIndex : class; the VideoIndex class
+    """
+
+    def __init__(self, fcount, keyframes, timestamps, vidsize = None,
+                 vidmtime = None):
+
+        self.fcount = int(fcount)
+        self.keyframes = np.asarray(keyframes, dtype = np.int64)
+        self.timestamps = np.asarray(timestamps, dtype = np.float64)
+        self.vidsize = vidsize
+        self.vidmtime = vidmtime
+
+
+    @classmethod
+    def build(cls, vidfile):
+
+        """Indexes a video, reading raw packets without decoding if possible"""
+
+        cap = None
+        rawread = hasattr(cv2, "CAP_PROP_LRF_HAS_KEY_FRAME")
+        if rawread:
+            cap = cv2.VideoCapture(vidfile, cv2.CAP_FFMPEG,
+                                   [cv2.CAP_PROP_FORMAT, -1])
+            rawread = cap.isOpened()
+        if not rawread:
+            cap = cv2.VideoCapture(vidfile)
+
+        keyframes, timestamps = [], []
+        while cap.grab():
+            if rawread and cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME):
+                keyframes.append(len(timestamps))
+            timestamps.append(cap.get(cv2.CAP_PROP_POS_MSEC))
+        cap.release()
+
+        stat = os.stat(vidfile)
+
+        return cls(len(timestamps), keyframes, timestamps, stat.st_size,
+                   stat.st_mtime)
+
+
+    @classmethod
+    def load(cls, indexfile, vidfile):
+
+        """Loads an index, returning None if it is missing or outdated"""
+
+        if not os.path.isfile(indexfile):
+            return None
+        try:
+            with open(indexfile, "rb") as f:
+                dat = np.load(f)
+                index = cls(dat["fcount"], dat["keyframes"], dat["timestamps"],
+                            int(dat["vidsize"]), float(dat["vidmtime"]))
+        except (IOError, ValueError, KeyError):
+            return None
+
+        stat = os.stat(vidfile)
+        if index.vidsize != stat.st_size or index.vidmtime != stat.st_mtime:
+            return None
+
+        return index
+
+
+    def save(self, indexfile):
+
+        with open(indexfile, "wb") as f:
+            np.savez(f, fcount = self.fcount, keyframes = self.keyframes,
+                     timestamps = self.timestamps, vidsize = self.vidsize,
+                     vidmtime = self.vidmtime)
+
+
+    def keyframe(self, frameloc):
+
+        """Returns the last keyframe at or before frameloc, or None"""
+
+        i = np.searchsorted(self.keyframes, frameloc, side = "right")
+        return None if i == 0 else int(self.keyframes[i-1])
+
+
+class FrameSource:
+
+    """
+    Reads frames from a video while keeping track of the decoder position,
+    such that short forward jumps are decoded sequentially and only
+    backward or long jumps require a (keyframe) seek
+
+    Parameters
+    ----------
+    vidfile : str; no default
+        Name of the video file to read frames from.
+    resizeval : float; default = 1
+        Value with which the frames are resized after decoding.
+    seekthresh : int; default = 25
+        Maximum number of frames to decode forward before a seek is used
+        instead.
+    vidindex : VideoIndex; default = None
+        Index of the video. When it holds keyframes, seeks go to the
+        keyframe before the requested frame and decode forward from there,
+        which is exact also for videos with a variable GOP length, and
+        forward jumps within the same GOP never seek.
+
+    Returns
+    -------
+    FrameSource : class; the FrameSource class
+    """
+
+    def __init__(self, vidfile, resizeval = 1, seekthresh = 25, vidindex = None):
+
+        self.resizeval = resizeval
+        self.seekthresh = seekthresh
+        self.cap = cv2.VideoCapture(vidfile)
+        self.pos = 0
+        self.decoded = None
+
+        self.keyframe = None
+        if vidindex is not None and len(vidindex.keyframes) > 0:
+            self.keyframe = vidindex.keyframe
+
+
+    def read(self, frameloc, dst = None):
+
+        """
+        Returns the resized frame at frameloc or None if it failed. The
+        frame is written into dst if it is an array of the right shape.
+        Without resizing, frames are decoded directly into dst, otherwise
+        they are decoded into a buffer that is reused for every frame
+        """
+
+        step = None if self.pos is None else frameloc - self.pos
+        seek = step is None or step < 0 or step > self.seekthresh
+        if self.keyframe is not None:
+            keyframe = self.keyframe(frameloc)
+            if seek and step is not None and step >= 0:
+                seek = keyframe is not None and keyframe > self.pos
+            if seek and keyframe is not None:
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, keyframe)
+                self.pos, step, seek = keyframe, frameloc - keyframe, False
+        if seek:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, frameloc)
+        else:
+            for _ in range(step):
+                if not self.cap.grab():
+                    self.pos = None
+                    return None
+
+        if self.resizeval == 1:
+            ret, frame = self.cap.read(dst)
+        else:
+            ret, self.decoded = self.cap.read(self.decoded)
+        self.pos = frameloc + 1 if ret else None
+        if not ret:
+            return None
+
+        return frame if self.resizeval == 1 else resize_frame(self.decoded,
+                                                              self.resizeval, dst)
+
+
+    def release(self):
+
+        self.cap.release()
+
+
+class FrameCache:
+
+    """
+    An LRU cache of decoded and resized video frames that is filled in the
+    background on both sides of the current frame position
+
+    Parameters
+    ----------
+    vidfile : str; no default
+        Name of the video file to read frames from.
+    resizeval : float; default = 1
+        Value with which the frames are resized before they are cached.
+    cachesize : int; default = 256
+        Memory budget of the cache in megabytes.
+    readahead : int; default = 25
+        Number of frames that are read ahead of the current frame. A third
+        of that number of frames is also read behind the current frame.
+    seekthresh : int; default = 25
+        Maximum forward jump in frames that is decoded sequentially instead
+        of with a seek.
+    vidindex : VideoIndex; default = None
+        Index of the video, used for the frame count and keyframe seeks.
+
+    The arrays of evicted frames are reused for newly decoded frames, such
+    that reading frames does not allocate memory once the cache is full.
+    The frame last returned by get is never reused while it is displayed.
+
+    Frames can also be requested without blocking, in which case the
+    background worker decodes the requested frame first. Requests are
+    coalesced: when a new frame is requested before the previous one was
+    decoded, only the latest request is decoded.
+
+    Returns
+    -------
+    FrameCache : class; the FrameCache class
+    """
+
+    def __init__(self, vidfile, resizeval = 1, cachesize = 256, readahead = 25,
+                 seekthresh = 25, vidindex = None):
+
+        self.vidfile = vidfile
+        self.resizeval = resizeval
+        self.seekthresh = seekthresh
+        self.vidindex = vidindex
+        self.maxbytes = int(cachesize * 1024 * 1024)
+        self.readahead = max(int(readahead), 0)
+        self.readbehind = int(self.readahead / 3)
+
+        self.frames = OrderedDict()
+        self.nbytes = 0
+        self.pool = []
+        self.poolsize = 4
+        self.held = None
+        self.framebytes = None
+        self.errors = set()
+        self.lock = threading.Condition()
+
+        self.source = self._source()
+        if vidindex is not None:
+            self.fcount = vidindex.fcount
+        else:
+            self.fcount = int(self.source.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+        self.centre = None
+        self.running = True
+        self.thread = threading.Thread(target = self._fill)
+        self.thread.daemon = True
+        self.thread.start()
+
+
+    def __contains__(self, frameloc):
+
+        with self.lock:
+            return frameloc in self.frames
+
+
+    def _source(self):
+
+        return FrameSource(self.vidfile, self.resizeval, self.seekthresh,
+                           self.vidindex)
+
+
+    def _store(self, frameloc, frame):
+
+        """Adds a frame to the cache and evicts least recently used frames"""
+
+        with self.lock:
+            if frameloc in self.frames:
+                self.frames[frameloc] = self.frames.pop(frameloc)
+                return
+            self.framebytes = frame.nbytes
+            self.frames[frameloc] = frame
+            self.nbytes += frame.nbytes
+            while self.nbytes > self.maxbytes and len(self.frames) > 1:
+                _, old = self.frames.popitem(last = False)
+                self.nbytes -= old.nbytes
+                if old is not self.held and len(self.pool) < self.poolsize:
+                    self.pool.append(old)
+
+
+    def _buffer(self):
+
+        """Returns an array of an evicted frame to decode into, or None"""
+
+        with self.lock:
+            return self.pool.pop() if len(self.pool) > 0 else None
+
+
+    def _window(self, centre):
+
+        """Returns the frames to read ahead and behind, within budget"""
+
+        ahead, behind = self.readahead, self.readbehind
+        if self.framebytes:
+            maxframes = max(int(self.maxbytes / self.framebytes) - 1, 0)
+            if ahead + behind > maxframes:
+                ahead = int(maxframes * 0.75)
+                behind = maxframes - ahead
+        last = self.fcount - 1 if self.fcount > 0 else centre + ahead
+        forward = list(range(centre + 1, min(centre + ahead, last) + 1))
+        backward = list(range(max(centre - behind, 0), centre))
+
+        return forward, backward
+
+
+    def _fill(self):
+
+        """Background worker that decodes frames around the centre frame"""
+
+        source = self._source()
+
+        while True:
+            with self.lock:
+                while self.running and self.centre is None:
+                    self.lock.wait()
+                if not self.running:
+                    break
+                centre = self.centre
+                self.centre = None
+
+            for block in [[centre]] + list(self._window(centre)):
+                with self.lock:
+                    missing = [f for f in block if f not in self.frames
+                               and f not in self.errors]
+                if len(missing) == 0:
+                    continue
+                for frameloc in missing:
+                    if self.centre is not None or not self.running:
+                        break
+                    frame = source.read(frameloc, self._buffer())
+                    if frame is None:
+                        with self.lock:
+                            self.errors.add(frameloc)
+                        break
+                    self._store(frameloc, frame)
+                if self.centre is not None or not self.running:
+                    break
+
+        source.release()
+
+
+    def get(self, frameloc, block = True):
+
+        """
+        Returns the frame, decoding it if it is not in the cache. When block
+        is False, a frame that is not in the cache is decoded in the
+        background instead and None is returned. None is also returned when
+        the frame cannot be decoded, which is then reported by failed
+        """
+
+        frame = self.ready(frameloc)
+        if frame is None and block and not self.failed(frameloc):
+            frame = self.source.read(frameloc, self._buffer())
+            with self.lock:
+                if frame is None:
+                    self.errors.add(frameloc)
+                else:
+                    self.held = frame
+            if frame is not None:
+                self._store(frameloc, frame)
+        self.setcentre(frameloc)
+
+        return frame
+
+
+    def ready(self, frameloc):
+
+        """Returns the frame if it is cached, marking it as displayed"""
+
+        with self.lock:
+            frame = self.frames.pop(frameloc, None)
+            if frame is not None:
+                self.frames[frameloc] = frame
+                self.held = frame
+
+        return frame
+
+
+    def failed(self, frameloc):
+
+        """Returns if decoding the frame failed"""
+
+        with self.lock:
+            return frameloc in self.errors
+
+
+    def nearest(self, frameloc):
+
+        """
+        Returns the position and frame of the cached frame nearest to
+        frameloc, or None
+        """
+
+        with self.lock:
+            if len(self.frames) == 0:
+                return None
+            nearest = min(self.frames, key = lambda f: abs(f - frameloc))
+            self.held = self.frames[nearest]
+
+            return nearest, self.held
+
+
+    def peek(self, frameloc):
+
+        """Returns the frame if it is cached, without decoding or moving"""
+
+        with self.lock:
+            return self.frames.get(frameloc)
+
+
+    def setcentre(self, frameloc):
+
+        """Moves the read-ahead window to a new frame position"""
+
+        with self.lock:
+            self.centre = frameloc
+            self.lock.notify()
+
+
+    def close(self):
+
+        """Stops the read-ahead worker and releases the video"""
+
+        with self.lock:
+            self.running = False
+            self.lock.notify()
+        self.thread.join()
+        self.source.release()
+        self.frames.clear()
+        self.pool = []
+        self.nbytes = 0
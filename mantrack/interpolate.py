@@ -0,0 +1,123 @@
+#! /usr/bin/env python
+################################################
+# This is the stand alone version of Mantrack, #
+# a tool from the AnimTrack package by J.W.    #
+# Jolles. Do not distribute!                   #
+################################################
+
+from __future__ import print_function
+
+import numpy as np
+
+
+METHODS = ["linear", "spline"]
+
+
+def flag_column(columns):
+
+    """
+    Returns the name of the column that flags the interpolated points of a
+    point type, e.g. "interp" for ["x","y"] and "finterp" for ["fx","fy"]
+    """
+
+    return columns[0][:-1] + "interp"
+
+
+def interpolate_points(frames, values, newframes, method = "linear"):
+
+    """
+    Interpolates the values (n x dims) at frames to newframes, either
+    linearly or with a cubic Hermite (Catmull-Rom type) spline. The spline
+    slopes only depend on the neighbouring points, such that changing a
+    point only changes the interpolation up to its second neighbours
+    """
+
+    frames = np.asarray(frames, dtype = float)
+    values = np.asarray(values, dtype = float)
+    newframes = np.asarray(newframes, dtype = float)
+
+    if method == "linear" or len(frames) < 3:
+        return np.column_stack([np.interp(newframes, frames, values[:, i])
+                                for i in range(values.shape[1])])
+
+    slopes = np.gradient(values, frames, axis = 0)
+    inds = np.clip(np.searchsorted(frames, newframes) - 1, 0, len(frames) - 2)
+    h = (frames[inds + 1] - frames[inds])[:, None]
+    t = ((newframes - frames[inds]) / h[:, 0])[:, None]
+    h00 = 2*t**3 - 3*t**2 + 1
+    h10 = t**3 - 2*t**2 + t
+    h01 = -2*t**3 + 3*t**2
+    h11 = t**3 - t**2
+
+    return (h00 * values[inds] + h10 * h * slopes[inds] +
+            h01 * values[inds + 1] + h11 * h * slopes[inds + 1])
+
+
+def _manual_points(store, id, columns, span = None):
+
+    """Returns the frames and coordinates of the manually tracked points of an id"""
+
+    frames, values = store.track(id, list(columns) + [flag_column(columns)], span)
+    manual = values[:, 2] != 1
+
+    return frames[manual], values[manual, :2]
+
+
+def interpolate_track(store, id, columns, method = "linear", around = None):
+
+    """
+    Interpolates the frames between the manually tracked points of an id and
+    point type in a store. Points that are flagged as interpolated are
+    replaced, manually tracked points are never changed.
+
+    Parameters
+    ----------
+    store : AnnotationStore; no default
+        The store with the tracked data, that should include the flag column.
+    id : str; no default
+        The id for which to interpolate.
+    columns : list; no default
+        The coordinate columns of the point type, for example ["fx","fy"].
+    method : ["linear","spline"]; default = "linear"
+        The interpolation method.
+    around : int; default = None
+        If provided, only the gaps near this frame are interpolated, which
+        is what changes when the point at this frame is changed.
+
+    Returns
+    -------
+    frames : array; the frames that changed
+    values : array; the new values of the coordinates for these frames
+    """
+
+    if around is None:
+        frames, values = _manual_points(store, id, columns)
+    else:
+        # only read the track around the frame, widening the window until
+        # it holds the third manual neighbours on each side, which set the
+        # spline slopes of the gaps that are interpolated
+        window = 100
+        while True:
+            span = (around - window, around + window)
+            frames, values = _manual_points(store, id, columns, span)
+            ind = np.searchsorted(frames, around)
+            if ((ind >= 3 or span[0] <= store.first) and
+                (len(frames) - ind >= 4 or span[1] >= store.last)):
+                break
+            window *= 4
+    if len(frames) < 2:
+        return np.array([], dtype = int), np.empty((0, 2))
+
+    start, stop = 0, len(frames) - 1
+    if around is not None:
+        start, stop = max(ind - 2, 0), min(ind + 2, len(frames) - 1)
+    newframes = np.arange(frames[start], frames[stop] + 1)
+    newframes = newframes[~np.isin(newframes, frames)]
+    if len(newframes) == 0:
+        return np.array([], dtype = int), np.empty((0, 2))
+    newvalues = interpolate_points(frames, values, newframes, method)
+
+    old = store.get_frames(newframes, id, columns)
+    changed = ~np.isclose(old, newvalues).all(axis = 1)
+
+    return newframes[changed], newvalues[changed]
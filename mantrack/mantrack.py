@@ -10,6 +10,8 @@ from six.moves import input
 
 import sys
 import os
+import time
+import threading
 import cv2
 import pandas as pd
 import numpy as np
@@ -20,6 +22,16 @@ from animlab.imutils import *
 from animlab.mathutils import *
 
 from .__version__ import __version__
+from .frames import FrameCache, VideoIndex, index_name, proxy_name, make_proxy
+from .datastore import AnnotationStore, SparseAnnotationStore, SharedAnnotationStore
+from .datastore import EditLog, EditJournal, Autosaver
+from .datastore import journal_name, find_journal, save_store, shared_name
+from .datastore import FORMATS, load_data, replace_data, _check_pyarrow
+from .render import TrackOverlay, RenderScheduler, InfoPanel, copy_into
+from .interpolate import METHODS, flag_column, interpolate_track
+from .assist import PointAssist
+from .batch import crop_range
+from .profiler import LatencyProfiler
 
 
 class Track_Manual:
@@ -45,6 +57,11 @@ class Track_Manual:
         If an extra careful count should be made for the total number of
         frames. This is necessary when videos likely contain dropped or
         replicated frames, which will otherwise likely result in an error.
+        The count is made with a single indexing pass that also records the
+        keyframes and timestamps, and is stored in an index file (.mtidx)
+        next to the datafile. The index is reused, also when safecount is
+        False, as long as the size and modification time of the video have
+        not changed.
     datacrop : boolean; default = False
         If the data should be cropped to the first and last manually tracked
         data point. When start and stopframes are provided datacrop will be
@@ -62,6 +79,86 @@ class Track_Manual:
         Name of a potential state variable that can be coded as 0 and 1.
     customstep : int; default = None
         Custom (forward) step size in frames.
+    cachesize : int; default = 256
+        Memory budget in megabytes for caching decoded and resized frames.
+    readahead : int; default = 25
+        Number of frames that are decoded in the background ahead of the
+        current frame, with a third of that number also decoded behind it.
+    seekthresh : int; default = 25
+        Maximum forward jump in frames for which frames are decoded
+        sequentially instead of seeking to the nearest keyframe. Backward
+        and longer jumps always seek.
+    drawwindow : int; default = None
+        Number of frames before and after the current frame for which all
+        tracked points are drawn (key "a"). By default the full track is
+        drawn, which may be slow to update for very long tracks.
+    displaytick : int; default = 15
+        Duration in milliseconds of a display tick. The display is redrawn
+        at most once per tick and only when something changed.
+    autosave : int; default = 300
+        Number of seconds between automatic saves of the data to the
+        datafile in the background, or None to not autosave. All edits are
+        also directly written to a journal file next to the datafile, which
+        is used to recover the edits when the session ends unexpectedly.
+        Recovered edits are saved to the datafile when the next session of
+        the video starts. Exiting without saving (esc) restores the datafile
+        to its state at the start of the session.
+    fileformat : ["csv","npz","feather","parquet"]; default = "csv"
+        Storage format of the trackingfile. The binary formats store typed
+        columns and are much faster to load and save for long videos. The
+        feather and parquet formats require the pyarrow package. Datafiles
+        can be converted losslessly between formats with convert_data.
+    sparse : boolean; default = False
+        If only the tracked points should be kept in memory instead of a row
+        for every frame and id. Recommended for very long videos with many
+        ids. The datafile is still saved with a row for every frame and id.
+    interpolate : ["linear","spline"]; default = None
+        If the frames between manually tracked points should be filled in
+        by interpolation, either linear or with a cubic spline. Each click
+        updates the interpolation around it and the "o" key interpolates the
+        full track of the current id and point type. Interpolated points are
+        flagged with a 1 in an extra column per point type ("interp",
+        "finterp", "binterp") and are drawn as open circles, such that only
+        outliers need to be corrected by clicking.
+    assist : ["template","flow"]; default = None
+        If a point should be suggested based on the point of the current id
+        and point type in the previous frame, found either with template
+        matching or optical flow in a small window around that point. The
+        suggestion is drawn as a square and can be accepted with the "g" key.
+    assistradius : int; default = 20
+        Maximum distance in (resized) pixels between the point in the
+        previous frame and the suggested point.
+    profile : boolean or str; default = False
+        If the latency of every keypress and mouse event should be recorded,
+        both in total and per stage (frame decoding, data lookups, drawing
+        and showing). The p50, p95 and p99 latencies are printed on exit and
+        with the "l" key. If a filename is provided, the timings are also
+        written to that (json) file on exit.
+    proxy : boolean; default = False
+        If the video should be transcoded once to a proxy video at the
+        working resolution (resizeval) in which every frame is a keyframe,
+        which is then used for display. This makes scrubbing with the
+        trackbar and jumping between frames real-time, especially for long
+        videos with few keyframes and with resizeval < 1. The proxy (.avi) is
+        stored next to the datafile and reused as long as the video does not
+        change. Coordinates are still stored at the original resolution.
+    asyncdecode : boolean; default = True
+        If frames that are not yet cached should be decoded in the
+        background, such that the windows keep responding during slow
+        seeks. Until the frame arrives the nearest cached frame is shown,
+        the info panel shows "Loading.." and clicks are ignored. When
+        frames are requested faster than they can be decoded, only the
+        latest is decoded.
+    shared : boolean or list; default = False
+        If the data should be shared live with other Track_Manual sessions
+        of the same video on the same machine, e.g. with each annotator
+        tracking different IDs. The data is kept in a memory-mapped file
+        next to the datafile and each session can only change the IDs it
+        tracks (ids), while the points of the other IDs are shown as open
+        gray circles and updated live. Provide the list of all IDs that are
+        tracked across the sessions if the datafile does not exist yet.
+        All sessions save to the datafile of the video (fileaction is
+        ignored), which then holds the data of all IDs.
 
     Returns
     -------
@@ -71,10 +168,18 @@ class Track_Manual:
     def __init__(self, vidfile, fileaction = "newfile", ids = ["1"],
                  ptypes = ["c"], safecount = False, datacrop = False,
                  firstframe = None, lastframe = None, resizeval = 1,
-                 statevar = None, customstep = None):
+                 statevar = None, customstep = None, cachesize = 256,
+                 readahead = 25, seekthresh = 25, drawwindow = None,
+                 displaytick = 15, autosave = 300, fileformat = "csv",
+                 sparse = False, interpolate = None, assist = None,
+                 assistradius = 20, profile = False, proxy = False,
+                 asyncdecode = True, shared = False):
 
         lineprint("Track Manual "+__version__+" started!\n", label = "AnimTrack")
 
+        self.profiler = LatencyProfiler(profile is not False)
+        self.profilefile = profile if isinstance(profile, str) else None
+
         check_media(vidfile)
 
         self.resizeval = resizeval
@@ -83,15 +188,49 @@ class Track_Manual:
         self.fileaction = fileaction
 
         self.vidfile = vidfile
-        self.datafile = name(self.vidfile, ".csv", fileaction)
+        assert fileformat in FORMATS,"File format "+str(fileformat)+" not supported, exiting.."
+        if fileformat in ["feather","parquet"]:
+            _check_pyarrow()
+        self.fileext = FORMATS[fileformat]
+        self.shared = shared is not False
+        self.datafile = name(self.vidfile, self.fileext, "append" if self.shared else fileaction)
+        recovered = None if self.shared else find_journal(self.vidfile, os.path.dirname(self.datafile))
+        if recovered is not None:
+            print("Found unsaved edits, continuing with "+os.path.split(recovered)[1]+"..")
+            self.datafile = recovered
         self.cap = cv2.VideoCapture(self.vidfile)
 
         self.fps, self.width, _, self.fcount = get_vid_params(self.cap)
         self.width = int(self.width * self.resizeval)
 
-        if safecount:
+        self.indexfile = index_name(self.vidfile, self.datafile)
+        self.vidindex = VideoIndex.load(self.indexfile, self.vidfile)
+        if self.vidindex is None and safecount:
             print("Running safe frame count..",end='')
-            self.fcount = safe_count(vidfile)
+            self.vidindex = VideoIndex.build(self.vidfile)
+            self.vidindex.save(self.indexfile)
+        if self.vidindex is not None:
+            self.fcount = self.vidindex.fcount
+
+        self.proxyfile = None
+        if proxy:
+            self.proxyfile = proxy_name(self.vidfile, self.datafile, self.resizeval)
+            tstart = time.time()
+            print("Preparing proxy video..", end=" ")
+            fcount = make_proxy(self.vidfile, self.proxyfile, self.resizeval)
+            print(os.path.split(self.proxyfile)[1], "ready in", round(time.time()-tstart, 1), "s..")
+            if self.vidindex is not None and fcount != self.fcount:
+                print("Proxy has", fcount, "instead of", self.fcount, "frames, not using proxy..")
+                self.proxyfile = None
+
+        if self.proxyfile is None:
+            self.framecache = FrameCache(self.vidfile, self.resizeval, cachesize,
+                                         readahead, seekthresh, self.vidindex)
+        else:
+            self.fcount = fcount
+            proxyindex = VideoIndex(fcount, np.arange(fcount), [])
+            self.framecache = FrameCache(self.proxyfile, 1, cachesize, readahead,
+                                         seekthresh, proxyindex)
 
         self.firstframe = firstframe if firstframe is not None else 1
         self.lastframe = lastframe if lastframe is not None else self.fcount
@@ -112,25 +251,63 @@ class Track_Manual:
         if statevar is not None:
             self.columns = self.columns + [statevar]
 
-        self.data = create_emptydf(self.columns, self.ids, self.firstframe, self.lastframe)
-        if os.path.isfile(self.datafile):
-            data = pd.read_csv(self.datafile, header = 0)
-            ind = data.loc[(data.frame == data.frame[0])].index[0]
-            data.index = list(range(ind, ind+len(data)))
-            self.data = data.combine_first(self.data)
-            print("Datafile "+os.path.split(self.datafile)[1]+" loaded..")
-            self.firstframe = int(self.data.frame[0])
-            self.lastframe = int(self.data.frame[len(data)-1])
-            missingcols = [col for col in self.columns if col not in list(self.data)]
-            missingids = [id for id in self.ids if id not in list(self.data.id)]
-            assert len(missingcols)==0,"Column(s) "+", ".join(missingcols)+" not in data, exiting.."
-            assert len(missingids)==0,"ID(s) "+", ".join(missingids)+" not in data, exiting.."
-        else:
-            if not self.datacrop:
-                framerange = str(self.firstframe)+":"+str(self.lastframe)
-                print("Frame range set to max, "+framerange+"..",end=" ")
-            print("Empty datafile '"+os.path.split(self.datafile)[1]+"' created..")
-        self.datacopy = self.data.copy()
+        self.interpolate = interpolate
+        flagcols = []
+        if interpolate is not None:
+            assert interpolate in METHODS,"Interpolation method "+str(interpolate)+" not supported, exiting.."
+            flagcols = [flag_column(i[1]) for i in self.types]
+            self.columns = self.columns + flagcols
+
+        self.assist = None
+        if assist is not None:
+            self.assist = PointAssist(assist, searchradius = assistradius)
+        self.suggestion = None
+
+        assert not (sparse and self.shared),"Shared data cannot be sparse, exiting.."
+        storetype = SparseAnnotationStore if sparse else AnnotationStore
+        storeids = self.ids
+        if isinstance(shared, (list, tuple)):
+            storeids = list(shared) + [id for id in self.ids if id not in shared]
+
+        self.autosave = autosave
+        self.datalock = threading.Lock()
+        self.store = None
+        try:
+            self.datafound = os.path.isfile(self.datafile)
+            if self.datafound:
+                self.store = storetype.from_df(load_data(self.datafile))
+                print("Datafile "+os.path.split(self.datafile)[1]+" loaded..")
+                self.firstframe = self.store.first
+                self.lastframe = self.store.last
+                self.store.add_columns([col for col in flagcols if col not in self.store.columns])
+                missingcols = [col for col in self.columns if col not in self.store.columns]
+                missingids = [id for id in self.ids if not self.store.has_id(id)]
+                assert len(missingcols)==0,"Column(s) "+", ".join(missingcols)+" not in data, exiting.."
+                assert len(missingids)==0,"ID(s) "+", ".join(missingids)+" not in data, exiting.."
+            else:
+                self.store = storetype(self.columns, storeids, self.firstframe, self.lastframe)
+                if not self.datacrop:
+                    framerange = str(self.firstframe)+":"+str(self.lastframe)
+                    print("Frame range set to max, "+framerange+"..",end=" ")
+                print("Empty datafile '"+os.path.split(self.datafile)[1]+"' created..")
+
+            if self.shared:
+                self.store = SharedAnnotationStore.open(shared_name(self.datafile),
+                                                        self.store, self.ids)
+                others = [str(id) for id in self.store.ids if not self.store.owns(id)]
+                print("Sharing data with IDs", ", ".join(others) if len(others) > 0 else "-", "..")
+                self.firstframe = self.store.first
+                self.lastframe = self.store.last
+                missingcols = [col for col in self.columns if col not in self.store.columns]
+                assert len(missingcols)==0,"Column(s) "+", ".join(missingcols)+" not in shared data, exiting.."
+
+            self.start_journal()
+        except Exception:
+            if isinstance(self.store, SharedAnnotationStore):
+                self.store.release()
+            self.framecache.close()
+            self.cap.release()
+            raise
 
         self.frameloc = self.firstframe - 1
 
@@ -142,12 +319,141 @@ class Track_Manual:
 
         self.drawcoords = False
         self.drawframes = False
+        self.drawwindow = drawwindow
+        self.overlays = {}
+        self.scheduler = RenderScheduler(displaytick)
+        self.winsize = None
+        self.scene = None
+        self.draw_frame = None
+        self.infopanel = InfoPanel()
+        self.draw_params = self.infopanel.img
+
+        framediff = self.lastframe-(self.firstframe+1)
+        self.nsteps, self.stepsize = maxsteps(framediff, 200)
+        self.stepsize = max(self.stepsize, 1)
+        self.barpos = 0
+        self.trackpos = 0
+        self.windows = False
+        self.status = None
+
+        self.asyncdecode = asyncdecode
+        self.frame = None
+        self.shownloc = None
+        self.loading = False
+        self.requested = None
 
         self.uset_id(False)
         self.uset_type(True)
 
-        self.show_windows()
-        cv2.setMouseCallback('Video', self.drawpoint)
+
+    def start_journal(self):
+
+        tag = "-".join(str(id) for id in self.ids) if self.shared else None
+        self.journal = EditJournal(journal_name(self.datafile, tag), self.vidfile)
+        nedits = EditJournal.replay(self.journal.journalfile, self.store)
+        if nedits > 0:
+            save_store(self.store, self.datafile)
+            self.journal.remove()
+            self.datafound = True
+            print(nedits, "unsaved edits recovered from journal and saved..")
+        self.editlog = EditLog()
+        self.autosaver = None
+        if self.autosave is not None:
+            self.autosaver = Autosaver(self.journal, lambda: self.store.copy(),
+                                       self.datafile, self.datalock, self.autosave)
+
+
+    def stop_autosave(self):
+
+        if self.autosaver is not None:
+            self.autosaver.stop()
+
+
+    def close(self):
+
+        """
+        Releases the video, frame cache, autosaver and shared data of an
+        instance without saving. It is called when tracking ends, also after
+        an error, and releases an instance that was prepared but never
+        tracked. Unsaved edits are kept in the journal
+        """
+
+        self.stop_autosave()
+        self.journal.close(self.journal.nedits == 0)
+        self.framecache.close()
+        self.cap.release()
+        if self.shared:
+            self.store.release()
+
+
+    def setdata(self, columns, values, frame = None, id = None, log = True,
+                newaction = True):
+
+        frame = self.frameloc+1 if frame is None else frame
+        id = self.id if id is None else id
+        with self.datalock:
+            if np.ndim(frame) == 0:
+                loc = self.store.loc(frame, id)
+                old = self.store.get(loc, columns)
+                self.store.set(loc, columns, values)
+            else:
+                old = self.store.get_frames(frame, id, columns)
+                self.store.set_frames(frame, id, columns, values)
+            self.journal.record(frame, id, columns, values)
+        if log:
+            self.editlog.record(frame, id, columns, old, values, newaction)
+
+
+    def fill(self, around = None):
+
+        frames, values = interpolate_track(self.store, self.id, self.subcolumns,
+                                           self.interpolate, around)
+        if len(frames) > 0:
+            values = np.column_stack([values, np.ones(len(frames))])
+            self.setdata(self.subcolumns + [self.flagcol], values, frames,
+                         newaction = around is None)
+
+        return frames
+
+
+    def update_overlay(self, first, last):
+
+        """Updates the points between two frames in the current track overlay"""
+
+        overlay = self.overlays.get((self.id, self.label, self.resizeval))
+        if overlay is None or overlay.coords is None:
+            return
+        if overlay.span is not None:
+            first, last = max(first, overlay.span[0]), min(last, overlay.span[1])
+            if first > last:
+                return
+        coords, framelist = self.store.coords(self.id, self.subcolumns, self.resizeval,
+                                              (first, last))
+        overlay.setrange(coords, framelist, first, last)
+
+
+    def undo(self, redo = False):
+
+        action = self.editlog.redo() if redo else self.editlog.undo()
+        if len(action) == 0:
+            print("Nothing to", "redo.." if redo else "undo..")
+            return
+        for edit in (action if redo else reversed(action)):
+            values = edit["new"] if redo else edit["old"]
+            self.setdata(edit["columns"], values, edit["frames"], edit["id"], False)
+        edit = action[0]
+        print("Redo" if redo else "Undo", "| Frame", "%5s" % str(edit["frame"]), "|", edit["id"], "| ", end='')
+        print(" ".join(edit["columns"]), "(" + str(len(action)) + " edits)" if len(action) > 1 else "")
+        self.overlays = {}
+        self.uset_frameloc(edit["frame"]-1-self.frameloc)
+
+
+    @property
+    def data(self):
+
+        """The tracked data as a dataframe in the datafile layout"""
+
+        return self.store.to_df()
 
 
     def show_windows(self):
@@ -158,31 +464,31 @@ class Track_Manual:
         cv2.namedWindow('Frame position', cv2.WINDOW_NORMAL)
         cv2.resizeWindow('Frame position', self.width+200, 30)
         cv2.moveWindow('Frame position', 0, 0)
-        framediff = self.lastframe-(self.firstframe+1)
-        nsteps, self.stepsize = maxsteps(framediff, 200)
-        self.stepsize = max(self.stepsize, 1)
-        self.barpos = 0
-        self.trackpos = 0
-        cv2.createTrackbar('Frame', 'Frame position', self.barpos, nsteps, nothing)
+        cv2.createTrackbar('Frame', 'Frame position', self.trackpos, self.nsteps, nothing)
 
         cv2.namedWindow('Info panel', cv2.WINDOW_AUTOSIZE)
-        cv2.imshow("Info panel", self.draw_params)
         cv2.moveWindow('Info panel', 0, 84)
 
         cv2.namedWindow('Video', cv2.WINDOW_AUTOSIZE)
-        cv2.imshow("Video", self.draw_frame)
         cv2.moveWindow('Video', 200, 84)
 
+        cv2.setMouseCallback('Video', self.drawpoint)
+        self.windows = True
+
+        self.infopanel.changed = True
+        self.scheduler.mark("scene")
+        self.render()
+
 
     def drawpoint(self, event, x, y, flags, param):
 
         if event == cv2.EVENT_LBUTTONDOWN:
             self.pt = (x,y)
-            self.draw()
             self.add = True
+            self.scheduler.mark("scene")
         elif event == cv2.EVENT_MOUSEMOVE:
             self.mousept = (x,y)
-            self.draw()
+            self.scheduler.mark("cursor")
 
 
     def uset_id(self, reset = True):
@@ -197,6 +503,7 @@ class Track_Manual:
         self.type = next(self.typepool)
         self.label = self.type[0]
         self.subcolumns = self.type[1]
+        self.flagcol = flag_column(self.subcolumns)
         self.col = namedcols(self.type[2])
         if reset:
             self.reset()
@@ -210,84 +517,206 @@ class Track_Manual:
         if self.frameloc <= self.firstframe-1:
             self.frameloc = self.firstframe-1
 
+        self.settrackbar()
+        self.reset()
+
+
+    def settrackbar(self):
+
         trackpos = int((self.frameloc-self.firstframe-1)/self.stepsize)
         self.trackpos = 0 if trackpos < 0 else trackpos
-        cv2.setTrackbarPos('Frame','Frame position', self.trackpos)
-        self.reset()
+        if self.windows:
+            cv2.setTrackbarPos('Frame','Frame position', self.trackpos)
+
+
+    def readerror(self):
+
+        """Goes back to the shown frame when a frame cannot be decoded"""
+
+        if self.frame is None:
+            raise IOError("Frame "+str(self.frameloc+1)+" of "+self.vidfile+" could not be read, exiting..")
+        print("Frame", self.frameloc+1, "could not be read, staying at frame", str(self.shownloc+1)+"..", end=" ")
+        print("Use safecount if the video has fewer frames than reported..")
+        self.frameloc = self.shownloc
+        self.settrackbar()
 
 
     def reset(self):
 
-        self.cap.set(cv2.CAP_PROP_POS_FRAMES, self.frameloc)
-        _, self.frame = self.cap.read()
-        self.frame = imresize(self.frame, self.resizeval)
+        block = not self.asyncdecode or self.frame is None
+        cached = self.profiler.enabled and self.frameloc in self.framecache
+        stage = "frame (cached)" if cached else "frame (decode)" if block else "frame (request)"
+        with self.profiler.stage(stage):
+            frame = self.framecache.get(self.frameloc, block)
+        if frame is None and (block or self.framecache.failed(self.frameloc)):
+            self.readerror()
+            frame = self.frame
+        self.loading = frame is None
+        if self.loading:
+            self.requested = self.profiler.clock()
+            nearest = self.framecache.nearest(self.frameloc)
+            if nearest is not None:
+                self.shownloc, frame = nearest
+        else:
+            self.shownloc = self.frameloc
+        if frame is not None:
+            self.frame = frame
         self.pt = None
-        self.loc = self.data.index[(self.data.frame == self.frameloc+1) & (self.data.id == self.id)][0]
-        self.draw()
+        with self.profiler.stage("lookup"):
+            self.loc = self.store.loc(self.frameloc+1, self.id)
+        self.suggestion = None
+        if not self.loading:
+            with self.profiler.stage("assist"):
+                self.suggest()
+        self.scheduler.mark("scene")
+
+
+    def poll_frame(self):
+
+        """
+        Shows the requested frame once it has been decoded, or goes back to
+        the shown frame if it could not be decoded
+        """
+
+        if not self.loading:
+            return
+        frame = self.framecache.ready(self.frameloc)
+        if frame is None:
+            if self.framecache.failed(self.frameloc):
+                self.loading = False
+                self.readerror()
+                self.reset()
+            return
+        self.frame = frame
+        self.shownloc = self.frameloc
+        self.loading = False
+        self.profiler.event("frame arrival", self.requested)
+        with self.profiler.stage("assist"):
+            self.suggest()
+        self.scheduler.mark("scene")
+
+
+    def suggest(self):
+
+        self.suggestion = None
+        if self.assist is None or self.frameloc+1 <= self.firstframe:
+            return
+        if self.store.point(self.loc, self.subcolumns) is not None:
+            return
+        prevloc = self.store.loc(self.frameloc, self.id)
+        prevpt = self.store.point(prevloc, self.subcolumns, self.resizeval)
+        prevframe = self.framecache.peek(self.frameloc-1)
+        self.suggestion = self.assist.suggest(prevframe, self.frame, prevpt)
+
+
+    def get_overlay(self):
+
+        key = (self.id, self.label, self.resizeval)
+        overlay = self.overlays.get(key)
+        if overlay is None:
+            overlay = TrackOverlay(self.frame.shape, self.col, self.drawframes)
+            self.overlays[key] = overlay
+
+        span = None
+        if self.drawwindow is not None:
+            span = (self.frameloc+1-self.drawwindow, self.frameloc+1+self.drawwindow)
+        if overlay.coords is None or overlay.span != span:
+            coords, framelist = self.store.coords(self.id, self.subcolumns, self.resizeval, span)
+            overlay.build(coords, framelist, span)
+
+        return overlay
 
 
     def draw(self):
 
+        # Draw all points
+        self.scene = copy_into(self.scene, self.frame)
+        if self.drawcoords:
+            with self.profiler.stage("overlay"):
+                self.get_overlay().composite(self.scene)
+
+        # Draw points of ids tracked in other sessions
+        if self.shared:
+            for id in self.store.ids:
+                if not self.store.owns(id):
+                    otherpt = self.store.point(self.store.loc(self.frameloc+1, id),
+                                               self.subcolumns, self.resizeval)
+                    if otherpt is not None:
+                        cv2.circle(self.scene, otherpt, 4, (128,128,128), 1)
+
         # Draw frame with points
-        self.draw_frame = self.frame.copy()
-        pt = pd_to_coords(self.data, self.loc, False, self.subcolumns, self.resizeval)
+        pt = self.store.point(self.loc, self.subcolumns, self.resizeval)
         if pt is not None:
-            cv2.circle(self.draw_frame, pt, 0, self.col, 5)
+            if self.interpolate is not None and self.store.get(self.loc, [self.flagcol])[0] == 1:
+                cv2.circle(self.scene, pt, 4, self.col, 1)
+            else:
+                cv2.circle(self.scene, pt, 0, self.col, 5)
         if self.pt is not None:
-            cv2.circle(self.draw_frame, self.pt, 0, self.col, 10)
+            cv2.circle(self.scene, self.pt, 0, self.col, 10)
             pt = self.pt
-        if self.mousept is not None:
-            draw_crosshair(self.draw_frame, self.mousept)
-
-        # Draw all points
-        if self.drawcoords:
-            sub = self.data[self.data.id == self.id].reset_index(drop=True)
-            coords, framelist = pd_to_coords(sub, None, True, self.subcolumns, self.resizeval)
-            cv2.polylines(self.draw_frame, [coords], False, (0,0,0), 1)
-            for i,coord in enumerate(coords):
-                coord = tuple(coord[0])
-                cv2.circle(self.draw_frame, coord, 0, self.col, 5)
-                if self.drawframes:
-                    draw_text(self.draw_frame, str(int(framelist[i])), (coord[0]-8,coord[1]), fontsize =  0.3)
+        elif self.suggestion is not None:
+            x, y = self.suggestion
+            cv2.rectangle(self.scene, (x-4, y-4), (x+4, y+4), self.col, 1)
 
         # Draw Params
-        self.draw_params = np.zeros((120,200,3), np.uint8)+255
-        draw_text(self.draw_params, "Frame:", (0,5), fontsize = 0.5)
-        draw_text(self.draw_params, str(self.frameloc+1), (68, 5), fontsize = 0.5)
-        draw_text(self.draw_params, "ID:", (0, 25), fontsize =  0.5)
-        draw_text(self.draw_params, str(self.id), (68, 25), fontsize =  0.5)
-        draw_text(self.draw_params, "Type:", (0, 45), fontsize = 0.5)
-        draw_text(self.draw_params, self.label, (68, 45), fontsize =  0.5, col = self.col)
-        draw_text(self.draw_params, "Coords                          :", (0, 65), fontsize =  0.5)
+        panel = self.infopanel
+        panel.setrow(0, [("Frame:", 0, "black"), (str(self.frameloc+1), 68, "black")])
+        panel.setrow(1, [("ID:", 0, "black"), (str(self.id), 68, "black")])
+        panel.setrow(2, [("Type:", 0, "black"), (self.label, 68, self.col)])
+        coords = [("Coords                          :", 0, "black")]
         if pt is not None:
-            draw_text(self.draw_params, str(pt), (68, 65), fontsize =  0.5)
+            coords.append((str(pt), 68, "black"))
+        panel.setrow(3, coords)
         if self.statevar is not None:
-            state = self.data.loc[self.loc, self.statevar]
+            state = self.store.get(self.loc, [self.statevar])[0]
             state = str(int(state)) if state == state else "nan"
-            draw_text(self.draw_params, "State ("+self.statevar+"): "+state, (0, 85), fontsize =  0.5)
+            panel.setrow(4, [("State ("+self.statevar+"): "+state, 0, "black")])
+        panel.setrow(5, [("Loading..", 0, "black")] if self.loading else [])
+
+
+    def render(self):
+
+        dirty = self.scheduler.take()
+        if len(dirty) == 0:
+            return
+
+        if "scene" in dirty:
+            with self.profiler.stage("draw"):
+                self.draw()
+                self.draw_frame = copy_into(self.draw_frame, self.scene)
+            self.scheduler.cursorbox = None
+            if self.infopanel.take():
+                with self.profiler.stage("show"):
+                    cv2.imshow("Info panel", self.draw_params)
+        with self.profiler.stage("cursor"):
+            self.scheduler.draw_cursor(self.draw_frame, self.scene, self.mousept)
+        with self.profiler.stage("show"):
+            cv2.imshow("Video", self.draw_frame)
+
+        height, width = self.draw_frame.shape[:2]
+        if self.winsize != (width, height):
+            self.winsize = (width, height)
+            cv2.resizeWindow('Info panel', 100,500)
+            cv2.resizeWindow('Video', int(width*0.5), height)
 
 
     def savedat(self):
 
-        rowchanges = dfchange(self.datacopy, self.data)[1]
+        rowchanges = len(self.editlog.changed())
         temp = "change" if rowchanges == 1 else "changes"
         print("User saved..", rowchanges, "row", temp, "recorded..", end= " ")
+        store = self.store
         if self.datacrop:
-            inds = list(self.data.dropna(thresh = 4).index)
-            if len(inds)==0:
+            frames = crop_range(self.store, self.ind_start, self.ind_stop)
+            if frames is None:
                 print("dataset was emtpy..")
             else:
-                if len(inds)<3:
-                    inds = [self.firstframe,self.lastframe]
-                inds = [inds[0],inds[-1]]
-                if self.ind_start != None:
-                    inds[0] = self.ind_start
-                if self.ind_stop != None:
-                    inds[1] = self.ind_stop
-                self.data = self.data.loc[inds[0]:inds[-1],]
-                print("dataset cropped to frames " + str(min(self.data.frame)) + ":" + str(max(self.data.frame)) + "..", end='')
-        if len(self.data) > 2:
-            self.data.to_csv(self.datafile, index = False)
+                store = self.store.copy()
+                store.crop(frames[0], frames[-1])
+                print("dataset cropped to frames " + str(store.first) + ":" + str(store.last) + "..", end='')
+        data = store.to_df()
+        if len(data) > 2:
+            replace_data(data, self.datafile)
 
 
     def keypress(self):
@@ -316,6 +745,21 @@ class Track_Manual:
         x : change state animal is in (0 <> 1). As the default state is NaN,
             make sure to press x twice to set state to 0!
 
+        Interpolation:
+        o : interpolate all frames between the manually tracked points of the
+            current ID and point type (requires interpolate to be set)
+
+        Point assist:
+        g : accept the suggested point (requires assist to be set)
+
+        Profiling:
+        l : print the latency of the events and their stages so far
+            (requires profile to be set)
+
+        Undo changes:
+        j : undo the last change to the data
+        k : redo the last undone change
+
         Visualisations:
         a : show/hide all currently tracked data as connected dots
         z : show/hide the framenumbers for the currently tracked data points
@@ -333,35 +777,87 @@ class Track_Manual:
         else:
 
             # save and create new file
-            if self.key == ord("n"):
+            if self.key == ord("n") and self.shared:
+                print("Cannot create an additional datafile for shared data..")
+                return True
+
+            elif self.key == ord("n"):
+                self.stop_autosave()
                 self.savedat()
-                self.data = self.datacopy.copy()
+                self.journal.close(True)
+                self.editlog.revert(self.store)
+                self.overlays = {}
                 print("File saved, created additional datafile..")
-                self.datafile = name(self.vidfile, ".csv", self.fileaction)
+                self.datafile = name(self.vidfile, self.fileext, self.fileaction)
+                self.datafound = False
+                self.start_journal()
                 return True
 
             # save and exit
             elif self.key == ord("s"):
+                self.stop_autosave()
                 self.savedat()
+                self.journal.close(True)
                 print("File saved, exiting..")
+                self.status = "saved"
                 return False
 
             # exit without saving
             elif self.key == 27:
-                self.data = self.datacopy.copy()
+                self.stop_autosave()
+                self.journal.close(True)
+                self.editlog.revert(self.store)
+                if self.autosaver is not None and self.autosaver.saved:
+                    if self.datafound:
+                        save_store(self.store, self.datafile)
+                    elif os.path.isfile(self.datafile):
+                        os.remove(self.datafile)
                 print("User exited.. changes discarded..")
+                self.status = "discarded"
                 return False
 
             # display changes
             else:
                 if self.key == ord("d"):
-                    dfchanges, nchanges = dfchange(self.datacopy, self.data)
+                    changed = self.editlog.changed()
+                    dfchanges = self.store.select([self.store.loc(*key) for key in changed])
+                    nchanges = len(changed)
                     print("\n", nchanges, "rows changed so far:")
                     print(dfchanges, end='\n')
 
                 # change display
                 else:
 
+                    # undo and redo
+                    if self.key in [ord("j"),ord("k")]:
+                        self.undo(redo = self.key == ord("k"))
+
+                    # interpolate current track
+                    if self.key == ord("o"):
+                        if self.interpolate is None:
+                            print("Interpolation not enabled..")
+                        else:
+                            frames = self.fill()
+                            if len(frames) > 0:
+                                self.update_overlay(frames[0], frames[-1])
+                            print("Interpolated", len(frames), "frames for", self.id, self.label, "..")
+                            self.scheduler.mark("scene")
+
+                    # print latency report
+                    if self.key == ord("l"):
+                        if self.profiler.enabled:
+                            self.profiler.report()
+                        else:
+                            print("Profiling not enabled..")
+
+                    # accept suggested point
+                    if self.key == ord("g"):
+                        if self.suggestion is None:
+                            print("No point suggested..")
+                        else:
+                            self.pt = self.suggestion
+                            self.add = True
+
                     # change id
                     if self.key == ord("i"):
                         self.uset_id()
@@ -378,6 +874,7 @@ class Track_Manual:
                     # toggle showing all frame numbers
                     if self.key == ord("z"):
                         self.drawframes = not self.drawframes
+                        self.overlays = {}
                         self.reset()
 
                     # go to user-provided frame
@@ -387,7 +884,7 @@ class Track_Manual:
 
                     # set start and end of data
                     if self.key in [ord("["),ord("]")]:
-                        ind = self.data.loc[(self.data.frame == self.frameloc)].index[0]
+                        ind = self.frameloc
                         self.datacrop = True
                         if self.key == ord("["):
                             print("Data will be cropped to start at frame",self.frameloc)
@@ -398,12 +895,12 @@ class Track_Manual:
 
                     # change state
                     if self.key == ord("x"):
-                        state = self.data.loc[self.loc, self.statevar]
+                        state = self.store.get(self.loc, [self.statevar])[0]
                         state = 1 if (state != state or state == 0) else 0
-                        self.data.loc[self.loc, self.statevar] = state
+                        self.setdata([self.statevar], state)
                         print("Frame", "%5s" % str(self.frameloc+1), "|", self.id, "| ", end='')
                         print("%10s" % self.statevar, "%1s" % str(int(state)))
-                        self.draw()
+                        self.scheduler.mark("scene")
 
                     # change frame
                     if self.key in [ord(x) for x in "qwertyu"]:
@@ -435,28 +932,79 @@ class Track_Manual:
                 self.reset()
 
 
+    def eventname(self):
+
+        """Returns the type of user event to be handled, or None"""
+
+        if self.key != 255:
+            return "key " + (chr(self.key) if 32 < self.key < 127 else str(self.key))
+        if self.add:
+            return "click"
+        if "scene" in self.scheduler.dirty:
+            return "trackbar"
+        if "cursor" in self.scheduler.dirty:
+            return "mouse move"
+
+        return None
+
+
     def track(self):
 
-        while True:
+        """
+        Opens the windows and runs the manual tracking until the user saves
+        or exits. Returns "saved" or "discarded"
+        """
 
-            cv2.imshow("Info panel", self.draw_params)
-            cv2.imshow("Video", self.draw_frame)
-            height, width = self.draw_frame.shape[:2]
-            cv2.resizeWindow('Info panel', 100,500)
-            cv2.resizeWindow('Video', int(width*0.5), height)
-            self.key = cv2.waitKey(1) & 0xff
-            self.movebar()
-
-            if self.keypress() is False:
-                break
-
-            if self.add:
-                realpt = (int(self.pt[0] * self.multiplier), int(self.pt[1] * self.multiplier))
-                self.data.loc[self.loc, self.subcolumns] = realpt
-                print("Frame", "%5s" % str(self.frameloc+1), "|", self.id, "| ", end='')
-                print("%2s" % " ".join(self.subcolumns), "%4s" % str(self.pt[0]), "%4s" % str(self.pt[1]))
-                self.add = False
-                self.draw()
+        self.show_windows()
 
-        cv2.destroyAllWindows()
-        cv2.waitKey(1)
+        try:
+            while True:
+
+                self.key = cv2.waitKey(self.scheduler.tick) & 0xff
+                tstart = self.profiler.clock()
+                self.movebar()
+                event = self.eventname()
+
+                if self.keypress() is False:
+                    break
+
+                # points can only be added to the frame that is shown
+                if self.add and self.loading:
+                    print("Frame", self.frameloc+1, "is still loading, point ignored..")
+                    self.pt = None
+                    self.add = False
+
+                if self.add:
+                    realpt = (int(self.pt[0] * self.multiplier), int(self.pt[1] * self.multiplier))
+                    frames = [self.frameloc+1]
+                    with self.profiler.stage("data"):
+                        if self.interpolate is None:
+                            self.setdata(self.subcolumns, realpt)
+                        else:
+                            self.setdata(self.subcolumns + [self.flagcol], realpt + (np.nan,))
+                            frames += list(self.fill(around = self.frameloc+1))
+                    self.update_overlay(min(frames), max(frames))
+                    print("Frame", "%5s" % str(self.frameloc+1), "|", self.id, "| ", end='')
+                    print("%2s" % " ".join(self.subcolumns), "%4s" % str(self.pt[0]), "%4s" % str(self.pt[1]))
+                    self.add = False
+                    self.suggestion = None
+                    self.scheduler.mark("scene")
+
+                self.poll_frame()
+                if self.shared and self.store.changed():
+                    self.scheduler.mark("scene")
+                self.render()
+                self.profiler.event(event, tstart)
+
+            if self.profiler.enabled:
+                self.profiler.report()
+                if self.profilefile is not None:
+                    self.profiler.dump(self.profilefile)
+                    print("Latencies written to "+self.profilefile+"..")
+        finally:
+            self.close()
+            cv2.destroyAllWindows()
+            cv2.waitKey(1)
+            self.windows = False
+
+        return self.status
@@ -0,0 +1,154 @@
+#! /usr/bin/env python
+################################################
+# This is the stand alone version of Mantrack, #
+# a tool from the AnimTrack package by J.W.    #
+# Jolles. Do not distribute!                   #
+################################################
+
+from __future__ import print_function
+
+import json
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+PERCENTILES = [50, 95, 99]
+
+
+class _Stage:
+
+    """Context manager that adds its duration to a list of samples"""
+
+    __slots__ = ["samples", "tstart"]
+
+    def __init__(self, samples):
+
+        self.samples = samples
+
+
+    def __enter__(self):
+
+        self.tstart = time.perf_counter()
+
+
+    def __exit__(self, *args):
+
+        self.samples.append(1000 * (time.perf_counter() - self.tstart))
+
+
+class _NoStage:
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *args):
+        pass
+
+
+_NOSTAGE = _NoStage()
+
+
+class LatencyProfiler:
+
+    """
+    Records how long each stage of handling a user event takes, as well as
+    the total latency of each event from the moment it is received until
+    the display is updated. Timings are kept in milliseconds and are
+    summarized as percentiles. When disabled, timing a stage does nothing.
+
+    Parameters
+    ----------
+    enabled : boolean; default = True
+        If the timings should be recorded.
+
+    Returns
+    -------
+    LatencyProfiler : class; the LatencyProfiler class
+    """
+
+    def __init__(self, enabled = True):
+
+        self.enabled = enabled
+        self.stages = OrderedDict()
+        self.events = OrderedDict()
+
+
+    def clock(self):
+
+        return time.perf_counter() if self.enabled else None
+
+
+    def stage(self, name):
+
+        """Returns a context manager that times a stage, e.g. "decode" """
+
+        if not self.enabled:
+            return _NOSTAGE
+        if name not in self.stages:
+            self.stages[name] = []
+
+        return _Stage(self.stages[name])
+
+
+    def event(self, name, tstart):
+
+        """Records the latency of an event that started at tstart"""
+
+        if not self.enabled or name is None:
+            return
+        latency = 1000 * (time.perf_counter() - tstart)
+        self.events.setdefault(name, []).append(latency)
+
+
+    @staticmethod
+    def _summarize(samples):
+
+        summary = OrderedDict()
+        for name, values in samples.items():
+            if len(values) == 0:
+                continue
+            values = np.asarray(values)
+            stats = OrderedDict([("n", len(values))])
+            for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+                stats["p"+str(p)] = round(float(v), 3)
+            stats["max"] = round(float(values.max()), 3)
+            summary[name] = stats
+
+        return summary
+
+
+    def summary(self):
+
+        """Returns the percentiles per stage and per event type"""
+
+        return {"stages": self._summarize(self.stages),
+                "events": self._summarize(self.events)}
+
+
+    def report(self):
+
+        """Prints the latency percentiles in milliseconds"""
+
+        summary = self.summary()
+        for part in ["events", "stages"]:
+            if len(summary[part]) == 0:
+                continue
+            width = max([len(name) for name in summary[part]] + [14])
+            print("\n%-*s %6s %9s %9s %9s %9s" % (width, part, "n", "p50 ms",
+                  "p95 ms", "p99 ms", "max ms"))
+            for name, stats in summary[part].items():
+                print("%-*s %6d %9.2f %9.2f %9.2f %9.2f" % (width, name, stats["n"],
+                      stats["p50"], stats["p95"], stats["p99"], stats["max"]))
+        print("")
+
+
+    def dump(self, filename):
+
+        """Writes the summary and all timings to a json file"""
+
+        dat = self.summary()
+        dat["timings"] = {"stages": self.stages, "events": self.events}
+        with open(filename, "w") as f:
+            json.dump(dat, f, indent = 1)
@@ -0,0 +1,269 @@
+#! /usr/bin/env python
+################################################
+# This is the stand alone version of Mantrack, #
+# a tool from the AnimTrack package by J.W.    #
+# Jolles. Do not distribute!                   #
+################################################
+
+from __future__ import print_function
+
+import cv2
+import numpy as np
+
+from animlab.utils import *
+from animlab.imutils import *
+
+
+def copy_into(dst, src):
+
+    """
+    Copies an image into a preallocated array and returns it, allocating
+    a new array only if dst is None or has a different shape
+    """
+
+    if dst is None or dst.shape != src.shape or dst.dtype != src.dtype:
+        dst = np.empty_like(src)
+    np.copyto(dst, src)
+
+    return dst
+
+
+class TrackOverlay:
+
+    """
+    A cached layer with the full track of a single id and point type, drawn
+    as a line of connected points with optional frame numbers. The layer is
+    only redrawn when the track changes, and then only in the region of the
+    points that changed. The layer is composited onto a frame with a mask.
+
+    Parameters
+    ----------
+    shape : tuple; no default
+        Shape of the (resized) video frames.
+    col : tuple; no default
+        BGR color of the points.
+    drawframes : boolean; default = False
+        If the frame numbers should be drawn next to the points.
+
+    Returns
+    -------
+    TrackOverlay : class; the TrackOverlay class
+    """
+
+    def __init__(self, shape, col, drawframes = False):
+
+        self.col = col
+        self.drawframes = drawframes
+        self.layer = np.zeros(shape, np.uint8)
+        self.mask = np.zeros(shape, np.uint8)
+        self.where = np.zeros(shape, bool)
+        self.coords = None
+        self.framelist = None
+        self.span = None
+
+
+    def _drawpoint(self, layer, mask, coord, frame):
+
+        cv2.circle(layer, coord, 0, self.col, 5)
+        cv2.circle(mask, coord, 0, (255,255,255), 5)
+        if self.drawframes:
+            loc = (coord[0]-8, coord[1])
+            draw_text(layer, str(int(frame)), loc, fontsize = 0.3)
+            draw_text(mask, str(int(frame)), loc, fontsize = 0.3, col = "white")
+
+
+    def _drawlines(self, layer, mask, coords):
+
+        cv2.polylines(layer, coords, False, (0,0,0), 1)
+        cv2.polylines(mask, coords, False, (255,255,255), 1)
+
+
+    def build(self, coords, framelist, span = None):
+
+        """Redraws the full layer from an array of coordinates and frames"""
+
+        self.span = span
+        self.layer[:] = 0
+        self.mask[:] = 0
+        self.coords = coords
+        self.framelist = list(framelist)
+        if len(coords) > 0:
+            self._drawlines(self.layer, self.mask, [coords])
+        for coord, frame in zip(coords, self.framelist):
+            self._drawpoint(self.layer, self.mask, tuple(coord[0]), frame)
+        np.greater(self.mask, 0, out = self.where)
+
+
+    def setrange(self, coords, framelist, first, last):
+
+        """
+        Replaces the points between the first and last frame by an array of
+        coordinates and frames, and only redraws the part of the layer that
+        they affect. Returns False when the layer has not been built yet
+        """
+
+        if self.coords is None:
+            return False
+        frames = np.asarray(self.framelist, dtype = int)
+        i1, i2 = np.searchsorted(frames, [first, last + 1])
+        old = self.coords[max(i1 - 1, 0):i2 + 1]
+        self.coords = np.concatenate([self.coords[:i1], coords, self.coords[i2:]])
+        self.framelist = self.framelist[:i1] + list(framelist) + self.framelist[i2:]
+        new = self.coords[max(i1 - 1, 0):i1 + len(framelist) + 1]
+
+        # Region with the changed points and lines to their neighbours
+        pts = np.concatenate([old, new]).reshape((-1, 2))
+        if len(pts) == 0:
+            return True
+        pad = 50 if self.drawframes else 3
+        height, width = self.layer.shape[:2]
+        x1, y1 = np.maximum(pts.min(axis = 0) - pad, 0)
+        x2, y2 = np.minimum(pts.max(axis = 0) + pad + 1, (width, height))
+        if x1 >= x2 or y1 >= y2:
+            return True
+        # Redraw everything that overlaps the region into a buffer that holds
+        # it completely, such that lines are clipped exactly as in build, and
+        # copy the region from it
+        pts = self.coords.reshape((-1, 2))
+        inds = np.array([], dtype = int)
+        if len(pts) > 1:
+            lo, hi = np.minimum(pts[:-1], pts[1:]), np.maximum(pts[:-1], pts[1:])
+            inds = np.flatnonzero((lo < (x2, y2)).all(axis = 1) & (hi >= (x1, y1)).all(axis = 1))
+        near = np.flatnonzero((pts >= (x1 - pad, y1 - pad)).all(axis = 1) &
+                              (pts < (x2 + pad, y2 + pad)).all(axis = 1))
+        box = np.concatenate([pts[inds], pts[inds + 1], pts[near] - pad,
+                              pts[near] + pad, [[x1, y1], [x2, y2]]])
+        bx1, by1 = np.maximum(box.min(axis = 0) - 1, 0)
+        bx2, by2 = np.minimum(box.max(axis = 0) + 2, (width, height))
+        layer = np.zeros((by2 - by1, bx2 - bx1) + self.layer.shape[2:], self.layer.dtype)
+        mask = np.zeros((by2 - by1, bx2 - bx1) + self.mask.shape[2:], self.mask.dtype)
+        pts = pts - np.array([bx1, by1], np.int32)
+        if len(inds) > 0:
+            self._drawlines(layer, mask, [pts[i:i+2].reshape((-1,1,2)) for i in inds])
+        for i in near:
+            self._drawpoint(layer, mask, tuple(pts[i]), self.framelist[i])
+        roi = (slice(y1 - by1, y2 - by1), slice(x1 - bx1, x2 - bx1))
+        self.layer[y1:y2, x1:x2] = layer[roi]
+        self.mask[y1:y2, x1:x2] = mask[roi]
+        np.greater(self.mask[y1:y2, x1:x2], 0, out = self.where[y1:y2, x1:x2])
+
+        return True
+
+
+    def composite(self, img):
+
+        """Copies the layer onto an image in place"""
+
+        np.copyto(img, self.layer, where = self.where)
+
+
+class RenderScheduler:
+
+    """
+    Keeps track of which parts of the display are outdated, such that event
+    callbacks only mark what changed while redrawing and showing the frames
+    happens at most once per display tick and only when something changed.
+    The "scene" consists of the frame with all points and the info panel,
+    while the "cursor" is the crosshair that is drawn on top of the scene.
+
+    Parameters
+    ----------
+    tick : int; default = 15
+        Duration of a display tick in milliseconds.
+
+    Returns
+    -------
+    RenderScheduler : class; the RenderScheduler class
+    """
+
+    def __init__(self, tick = 15):
+
+        self.tick = max(int(tick), 1)
+        self.dirty = set()
+        self.cursorbox = None
+
+
+    def mark(self, *parts):
+
+        self.dirty.update(parts)
+
+
+    def take(self):
+
+        """Returns the dirty parts and marks everything as up to date"""
+
+        dirty, self.dirty = self.dirty, set()
+        return dirty
+
+
+    def draw_cursor(self, img, scene, pt, radius = 5):
+
+        """
+        Moves the crosshair on an image that holds the scene, restoring only
+        the area of the previous crosshair from the scene
+        """
+
+        if self.cursorbox is not None:
+            y1, y2, x1, x2 = self.cursorbox
+            img[y1:y2, x1:x2] = scene[y1:y2, x1:x2]
+            self.cursorbox = None
+        if pt is not None:
+            draw_crosshair(img, pt, radius)
+            height, width = img.shape[:2]
+            self.cursorbox = (max(pt[1]-radius-1, 0), min(pt[1]+radius+2, height),
+                              max(pt[0]-radius-1, 0), min(pt[0]+radius+2, width))
+
+
+class InfoPanel:
+
+    """
+    The info panel with the frame number, id, point type and coordinates.
+    The panel is drawn into a single preallocated image and each row is
+    only redrawn when its text changed.
+
+    Parameters
+    ----------
+    width : int; default = 200
+        Width of the panel in pixels.
+    nrows : int; default = 6
+        Number of rows of text.
+    rowheight : int; default = 20
+        Height of a row in pixels.
+
+    Returns
+    -------
+    InfoPanel : class; the InfoPanel class
+    """
+
+    def __init__(self, width = 200, nrows = 6, rowheight = 20):
+
+        self.rowheight = rowheight
+        self.img = np.zeros((nrows * rowheight, width, 3), np.uint8) + 255
+        self.rows = [None] * nrows
+        self.changed = True
+
+
+    def setrow(self, row, texts, fontsize = 0.5):
+
+        """
+        Sets the texts of a row, as a list of (text, x, col) tuples, and
+        redraws the row if they changed
+        """
+
+        texts = tuple(texts)
+        if self.rows[row] == texts:
+            return
+        self.rows[row] = texts
+        y = 5 + row * self.rowheight
+        self.img[y:y+self.rowheight] = 255
+        for text, x, col in texts:
+            draw_text(self.img, text, (x, y), fontsize = fontsize, col = col)
+        self.changed = True
+
+
+    def take(self):
+
+        """Returns if the panel changed and marks it as up to date"""
+
+        changed, self.changed = self.changed, False
+        return changed
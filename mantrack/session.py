@@ -0,0 +1,171 @@
+#! /usr/bin/env python
+################################################
+# This is the stand alone version of Mantrack, #
+# a tool from the AnimTrack package by J.W.    #
+# Jolles. Do not distribute!                   #
+################################################
+
+from __future__ import print_function
+
+import os
+import time
+import threading
+
+from animlab.utils import *
+
+from .datastore import FORMATS, find_journal
+from .mantrack import Track_Manual
+
+
+class TrackSession:
+
+    """
+    Manually tracks a queue of videos one after the other. While a video is
+    being tracked, the next video in the queue is prepared in the background
+    (opening the video, decoding the first frames and loading or creating
+    the datafile), such that switching to the next video is instant.
+    Saving a video ("s") continues with the next video, while exiting
+    without saving (esc) stops the session.
+
+    Parameters
+    ----------
+    vidfiles : list; no default
+        Names of the video files to be manually tracked, in order.
+    preload : boolean; default = True
+        If the next video should be prepared in the background.
+    skipdone : boolean; default = False
+        If videos that already have a datafile should be skipped, such that
+        an interrupted session can be continued. Videos with a leftover
+        journal of unsaved edits are not skipped.
+    vidparams : dict; default = None
+        Parameters of Track_Manual that differ per video, as a dictionary
+        with a dictionary of parameters for each video file, e.g.
+        {"vid1.mp4": {"ids": ["F01","F02"]}}.
+    **kwargs
+        Parameters of Track_Manual that are the same for all videos.
+
+    Returns
+    -------
+    TrackSession : class; the TrackSession class
+    """
+
+    def __init__(self, vidfiles, preload = True, skipdone = False,
+                 vidparams = None, **kwargs):
+
+        self.vidfiles = list(vidfiles)
+        self.preload = preload
+        self.vidparams = {} if vidparams is None else vidparams
+        self.kwargs = kwargs
+        self.status = dict((vidfile, "pending") for vidfile in self.vidfiles)
+
+        if skipdone:
+            ext = FORMATS[kwargs.get("fileformat", "csv")]
+            for vidfile in self.vidfiles:
+                if find_journal(vidfile, os.path.dirname(vidfile)) is not None:
+                    continue
+                if os.path.isfile(os.path.splitext(vidfile)[0] + ext):
+                    self.status[vidfile] = "skipped"
+
+        self.nextvid = None
+        self.thread = None
+        self.prepared = None
+
+
+    def _params(self, vidfile):
+
+        params = dict(self.kwargs)
+        params.update(self.vidparams.get(vidfile, {}))
+
+        return params
+
+
+    def _prepare(self, vidfile):
+
+        try:
+            self.prepared = Track_Manual(vidfile, **self._params(vidfile))
+        except Exception as e:
+            self.prepared = e
+
+
+    def _start(self, vidfile):
+
+        """Starts preparing a video in the background"""
+
+        self.nextvid = vidfile
+        self.prepared = None
+        self.thread = threading.Thread(target = self._prepare, args = (vidfile,))
+        self.thread.daemon = True
+        self.thread.start()
+
+
+    def _take(self, vidfile):
+
+        """Returns the tracking instance of a video, preparing it if needed"""
+
+        if self.nextvid != vidfile:
+            self._drop()
+            self._start(vidfile)
+        self.thread.join()
+        tracker, self.nextvid, self.prepared = self.prepared, None, None
+        if isinstance(tracker, Exception):
+            raise tracker
+
+        return tracker
+
+
+    def _drop(self):
+
+        """Releases a video that was prepared but will not be tracked"""
+
+        if self.thread is None:
+            return
+        self.thread.join()
+        if isinstance(self.prepared, Track_Manual):
+            self.prepared.close()
+        self.thread, self.nextvid, self.prepared = None, None, None
+
+
+    @property
+    def pending(self):
+
+        return [vidfile for vidfile in self.vidfiles
+                if self.status[vidfile] == "pending"]
+
+
+    def progress(self):
+
+        """Returns the number of finished and the total number of videos"""
+
+        ndone = sum(1 for status in self.status.values() if status != "pending")
+
+        return ndone, len(self.vidfiles)
+
+
+    def run(self):
+
+        """Tracks the pending videos until they are all done or the user exits"""
+
+        try:
+            while len(self.pending) > 0:
+                vidfile = self.pending[0]
+                ndone, ntotal = self.progress()
+                lineprint("Video "+str(ndone+1)+"/"+str(ntotal)+": "+vidfile, label = "AnimTrack")
+                tstart = time.time()
+                tracker = self._take(vidfile)
+                print("Video ready in", round(time.time()-tstart, 2), "s..")
+
+                if self.preload and len(self.pending) > 1:
+                    self._start(self.pending[1])
+
+                status = tracker.track()
+                if status == "discarded":
+                    print("Session stopped,", len(self.pending), "videos remaining..")
+                    break
+                self.status[vidfile] = "done"
+        finally:
+            self._drop()
+
+        ndone, ntotal = self.progress()
+        print("Session finished,", ndone, "of", ntotal, "videos done..")
+
+        return self.status
@@ -72,11 +72,14 @@ if __name__ == "__main__":
           download_url=DOWNLOAD_URL,
           version=__version__,
           install_requires=install_requires,
+          python_requires='>=3.7',
           packages=['mantrack'],
+          entry_points={'console_scripts':
+                        ['mantrack-batch = mantrack.batch:main']},
           classifiers=[
                      'Intended Audience :: Science/Research',
-                     'Programming Language :: Python :: 2.7',
                      'Programming Language :: Python :: 3',
+                     'Programming Language :: Python :: 3 :: Only',
                      'License :: OSI Approved :: Apache Software License',
                      'Topic :: Scientific/Engineering :: Visualization',
                      'Topic :: Scientific/Engineering :: Image Recognition',